@@ -0,0 +1,100 @@
+"""
+Генератор синтетических данных для бенчмарков.
+
+Для заданного размера N создает в каталоге data/ файлы в тех же форматах,
+что и приложение: users.json (N пользователей), portfolios.json (N
+портфелей), rates.json (текущие курсы) и exchange_rates.json (N записей
+истории). Данные полностью определяются размером и seed.
+"""
+import hashlib
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+REAL_CURRENCIES = ("EUR", "GBP", "RUB", "BTC", "ETH", "SOL")
+BASE_RATES = {"EUR": 1.16, "GBP": 1.34, "RUB": 0.0125, "BTC": 91103.0, "ETH": 3115.87, "SOL": 140.65}
+MAX_CURRENCIES = 1000  # матрица конверсии плотная, поэтому число валют ограничено
+BASE_TIME = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+PASSWORD = 'benchpass'
+# Пароль всех пользователей; хеш совпадает с cli.interface.hash_password
+HASHED_PASSWORD = hashlib.sha256((PASSWORD + 'somesalt').encode()).hexdigest()
+
+
+def username(i: int) -> str:
+    return f"user{i:07d}"
+
+
+def currency_codes(size: int):
+    """Валюты набора: реальные коды и синтетические X0001... (растут с размером)."""
+    extra = min(MAX_CURRENCIES, max(0, size // 1000)) - len(REAL_CURRENCIES)
+    return list(REAL_CURRENCIES) + [f"X{i:04d}" for i in range(1, extra + 1)]
+
+
+def make_rates(size: int, rng: random.Random) -> dict:
+    """Курсы всех валют набора к USD: {"BTC_USD": 91103.0, ...}."""
+    return {
+        f"{code}_USD": BASE_RATES.get(code) or round(rng.uniform(0.001, 500.0), 6)
+        for code in currency_codes(size)
+    }
+
+
+def _dump(path: str, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def generate(directory: str, size: int, seed: int = 42) -> dict:
+    """Записывает набор данных размера size в directory/data. Возвращает число записей по файлам."""
+    rng = random.Random(seed)
+    data_dir = os.path.join(directory, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    codes = currency_codes(size)
+    rates = make_rates(size, rng)
+
+    users = []
+    portfolios = []
+    for i in range(1, size + 1):
+        users.append({
+            "user_id": i,
+            "username": username(i),
+            "hashed_password": HASHED_PASSWORD,
+            "registration_date": str(BASE_TIME + timedelta(seconds=i)),
+        })
+        wallets = {"USD": {"balance": round(rng.uniform(1000.0, 200000.0), 2)}}
+        for code in rng.sample(codes, rng.randint(0, min(3, len(codes)))):
+            wallets[code] = {"balance": round(rng.uniform(0.0, 100.0), 6)}
+        portfolios.append({"user_id": i, "wallets": wallets})
+    _dump(os.path.join(data_dir, 'users.json'), users)
+    _dump(os.path.join(data_dir, 'portfolios.json'), portfolios)
+
+    refreshed = BASE_TIME.isoformat()
+    _dump(os.path.join(data_dir, 'rates.json'), {
+        "pairs": {
+            pair: {"rate": rate, "updated_at": refreshed, "source": "BenchmarkDataset"}
+            for pair, rate in rates.items()
+        },
+        "last_refresh": refreshed,
+    })
+
+    pairs = list(rates)
+    history = []
+    for i in range(size):
+        pair = pairs[i % len(pairs)]
+        from_currency, to_currency = pair.split('_')
+        timestamp = (BASE_TIME - timedelta(seconds=size - i)).isoformat()
+        history.append({
+            "id": f"{pair}_{timestamp}",
+            "from_currency": from_currency,
+            "to_currency": to_currency,
+            "rate": round(rates[pair] * rng.uniform(0.95, 1.05), 6),
+            "timestamp": timestamp,
+            "source": "BenchmarkDataset",
+            "meta": {"raw_id": from_currency.lower(), "request_ms": 0, "status_code": 200, "etag": ""},
+        })
+    _dump(os.path.join(data_dir, 'exchange_rates.json'), {
+        "rates": history,
+        "metadata": {"last_refresh": refreshed},
+    })
+    return {"users": size, "portfolios": size, "pairs": len(rates), "history": size}
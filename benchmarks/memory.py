@@ -0,0 +1,87 @@
+"""
+Память на один кошелек: объекты Wallet, словари балансов и WalletTable.
+
+Кошельки строятся из одного детерминированного набора (как в
+benchmarks/datasets.py), объем считается через tracemalloc.
+
+    python -m benchmarks.memory --wallets 1000000
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+
+from benchmarks import datasets
+from valutatrade_hub.core.models import Wallet
+from valutatrade_hub.core.wallet_table import WalletTable
+
+
+def make_rows(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    codes = ['USD'] + datasets.currency_codes(count)
+    return [(i // 3 + 1, codes[i % len(codes)], round(rng.uniform(0.0, 1000.0), 6)) for i in range(count)]
+
+
+def measure(build, rows) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(rows)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return used
+
+
+def build_wallets(rows):
+    # Прежний PortfolioStore: {user_id: {код: Wallet}}
+    portfolios = {}
+    for user_id, code, balance in rows:
+        portfolios.setdefault(user_id, {})[code] = Wallet(code, balance)
+    return portfolios
+
+
+def build_dicts(rows):
+    # Прежний BufferedPortfolioRepository: {user_id: {код: баланс}}
+    portfolios = {}
+    for user_id, code, balance in rows:
+        portfolios.setdefault(user_id, {})[code] = balance
+    return portfolios
+
+
+def build_table(rows):
+    return WalletTable.from_wallets(rows)
+
+
+VARIANTS = {
+    'Wallet': build_wallets,
+    'dict': build_dicts,
+    'WalletTable': build_table,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Память на кошелек для разных моделей')
+    parser.add_argument('--wallets', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Сохранить результаты в JSON')
+    args = parser.parse_args(argv)
+
+    rows = make_rows(args.wallets, args.seed)
+    results = {}
+    print(f"Кошельков: {args.wallets}")
+    for name, build in VARIANTS.items():
+        used = measure(build, rows)
+        results[name] = {"bytes_total": used, "bytes_per_wallet": round(used / args.wallets, 1)}
+        print(f"- {name:<12} {used / 2**20:8.1f} МБ, {used / args.wallets:6.1f} байт на кошелек")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"wallets": args.wallets, "results": results}, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
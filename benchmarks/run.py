@@ -0,0 +1,197 @@
+"""
+Бенчмарки команд CLI на синтетических данных.
+
+Для каждого размера набора данных (см. benchmarks/datasets.py) запускает
+отдельный процесс в каталоге с этим набором и замеряет команды register,
+login, buy, sell, show-portfolio, show-rates и RatesUpdater.run_update
+с клиентом-заглушкой. Результаты пишутся в JSON; с --baseline сравниваются
+с прошлым запуском, и при замедлении больше порога код выхода — 1.
+
+    python -m benchmarks.run --sizes 1000 10000 100000
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import datasets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_OUTPUT = os.path.join(ROOT, 'benchmarks', 'results', 'latest.json')
+
+
+class StubClient:
+    """Клиент-заглушка для RatesUpdater: возвращает курсы набора данных без сети."""
+
+    def __init__(self, rates: dict):
+        self.rates = rates
+        self.calls = 0
+
+    def fetch_rates(self) -> dict:
+        self.calls += 1
+        # Курсы слегка меняются от вызова к вызову, чтобы обновление не было пустым
+        factor = 1 + self.calls * 1e-4
+        return {pair: rate * factor for pair, rate in self.rates.items()}
+
+
+def timed(fn, repeat: int) -> dict:
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "max_ms": round(max(samples), 4),
+    }
+
+
+def run_worker(size: int, repeat: int, seed: int) -> dict:
+    """Замеры в текущем каталоге (в нем лежат config.json и data/ набора)."""
+    import random
+    from valutatrade_hub.cli import interface
+    from valutatrade_hub.infra import database
+    from valutatrade_hub.parser_service import storage
+    from valutatrade_hub.parser_service.updater import RatesUpdater
+
+    parser = interface.build_parser()
+
+    def command(line):
+        args = parser.parse_args(line.split())
+        with contextlib.redirect_stdout(io.StringIO()):
+            interface.dispatch(args)
+
+    results = {}
+    # Первое обращение к хранилищу (для sqlite — миграция JSON в базу)
+    results['load'] = timed(lambda i: (database.get_user_repository(), database.get_portfolio_repository()), 1)
+    results['register'] = timed(
+        lambda i: command(f"register --username bench{i:05d} --password {datasets.PASSWORD}"), repeat)
+    login_user = datasets.username(max(1, size // 2))
+    results['login'] = timed(
+        lambda i: command(f"login --username {login_user} --password {datasets.PASSWORD}"), repeat)
+    results['buy'] = timed(lambda i: command("buy --currency BTC --amount 0.001"), repeat)
+    results['sell'] = timed(lambda i: command("sell --currency BTC --amount 0.0005"), repeat)
+    results['show-portfolio'] = timed(lambda i: command("show-portfolio --base USD"), repeat)
+    results['show-rates'] = timed(lambda i: command("show-rates --top 10"), repeat)
+
+    client = StubClient(datasets.make_rates(size, random.Random(seed)))
+    updater = RatesUpdater(api_clients=[client], storage=storage, concurrent=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results['update-rates'] = timed(lambda i: updater.run_update(), repeat)
+
+    database.close_repositories()
+    return results
+
+
+def run_size(size: int, backend: str, repeat: int, seed: int, workdir: str = None) -> dict:
+    directory = tempfile.mkdtemp(prefix=f'vt-bench-{size}-', dir=workdir)
+    try:
+        started = time.perf_counter()
+        counts = datasets.generate(directory, size, seed)
+        generate_ms = (time.perf_counter() - started) * 1000
+        with open(os.path.join(directory, 'config.json'), 'w') as f:
+            json.dump({"storage_backend": backend}, f)
+
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run', '--worker',
+             '--sizes', str(size), '--repeat', str(repeat), '--seed', str(seed)],
+            cwd=directory, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Бенчмарк размера {size} завершился с ошибкой:\n{completed.stderr}")
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        return {"records": counts, "generate_ms": round(generate_ms, 1), "commands": timings}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(current: dict, baseline: dict, threshold: float):
+    """Сравнивает медианы с базовым запуском. Возвращает список замедлений."""
+    regressions = []
+    print(f"{'размер':>8} {'команда':<16} {'база, мс':>10} {'сейчас, мс':>11} {'отношение':>9}")
+    for size, result in current['results'].items():
+        base_result = baseline.get('results', {}).get(size)
+        if base_result is None:
+            continue
+        for name, timing in result['commands'].items():
+            base_timing = base_result['commands'].get(name)
+            if not base_timing or not base_timing['median_ms']:
+                continue
+            ratio = timing['median_ms'] / base_timing['median_ms']
+            mark = ''
+            if ratio > 1 + threshold:
+                mark = '  <- медленнее'
+                regressions.append((size, name, ratio))
+            print(f"{size:>8} {name:<16} {base_timing['median_ms']:>10.3f} "
+                  f"{timing['median_ms']:>11.3f} {ratio:>8.2f}x{mark}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарки команд ValutaTrade Hub')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Размеры наборов данных (от 1000 до 1000000)')
+    parser.add_argument('--backend', default='sqlite', help='storage_backend для замеров')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов каждой команды')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Файл результатов (JSON)')
+    parser.add_argument('--baseline', help='Результаты прошлого запуска для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Допустимое замедление медианы (0.2 = 20%%)')
+    parser.add_argument('--workdir', help='Каталог для временных наборов данных')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.sizes[0], args.repeat, args.seed)))
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        print(f"Размер {size}...", flush=True)
+        results[str(size)] = run_size(size, args.backend, args.repeat, args.seed, args.workdir)
+        for name, timing in results[str(size)]['commands'].items():
+            print(f"  {name:<16} медиана {timing['median_ms']:.3f} мс (мин {timing['min_ms']:.3f})")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Замедлений больше {args.threshold:.0%}: {len(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from valutatrade_hub.core import usecases
+from valutatrade_hub.core.exceptions import OrderBatchError
+from valutatrade_hub.core.usecases import Order, execute_orders
+from valutatrade_hub.infra import database
+from valutatrade_hub.infra.database import SQLiteRepository
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    rates_path = tmp_path / 'rates.json'
+    rates_path.write_text(json.dumps({'pairs': {
+        'BTC_USD': {'rate': 50000.0, 'updated_at': '2026-01-01T00:00:00+00:00', 'source': 'test'},
+        'EUR_USD': {'rate': 1.25, 'updated_at': '2026-01-01T00:00:00+00:00', 'source': 'test'},
+    }}))
+    monkeypatch.setitem(usecases.config._config, 'rates_path', str(rates_path))
+
+    repository = SQLiteRepository(str(tmp_path / 'valutatrade.db'))
+    repository.create_portfolios_batch({1: {'USD': 100000.0}, 2: {'BTC': 1.0}})
+    monkeypatch.setattr(database, 'get_portfolio_repository', lambda: repository)
+    yield repository
+    repository.close()
+
+
+def test_orders_are_applied(repository):
+    results = execute_orders([
+        Order(1, 'buy', 'BTC', 1.5),
+        {'user_id': 2, 'side': 'sell', 'currency_code': 'BTC', 'amount': 0.5},
+        Order(1, 'sell', 'BTC', 0.5),
+    ])
+
+    assert [result.ok for result in results] == [True, True, True]
+    assert results[0].rate == 50000.0
+    assert results[0].usd_amount == 75000.0
+    assert repository.get_wallets(1) == {'USD': 50000.0, 'BTC': 1.0}
+    assert repository.get_wallets(2) == {'BTC': 0.5, 'USD': 25000.0}
+
+
+def test_orders_see_earlier_orders_of_the_batch(repository):
+    # Второй ордер оплачивается из USD, полученных первым
+    results = execute_orders([
+        Order(2, 'sell', 'BTC', 1.0),
+        Order(2, 'buy', 'EUR', 40000.0),
+    ])
+    assert all(result.ok for result in results)
+    assert repository.get_wallets(2) == {'BTC': 0.0, 'USD': 0.0, 'EUR': 40000.0}
+
+
+@pytest.mark.parametrize('order, error', [
+    (Order(1, 'buy', 'BTC', 3.0), "Недостаточно средств"),
+    (Order(2, 'sell', 'BTC', 2.0), "Недостаточно средств"),
+    (Order(1, 'buy', 'XYZ', 1.0), "XYZ"),
+    (Order(1, 'buy', 'BTC', -1.0), "больше нуля"),
+    (Order(1, 'buy', 'BTC', float('nan')), "больше нуля"),
+    (Order(1, 'buy', 'BTC', 'много'), "Сумма должна быть числом"),
+    (Order('abc', 'buy', 'BTC', 1.0), "Некорректный user_id"),
+    (Order(1, 'hold', 'BTC', 1.0), "Неизвестный тип ордера"),
+])
+def test_atomic_batch_is_rejected_as_a_whole(repository, order, error):
+    with pytest.raises(OrderBatchError) as excinfo:
+        execute_orders([Order(1, 'buy', 'EUR', 100.0), order])
+
+    results = excinfo.value.results
+    assert results[0].ok
+    assert not results[1].ok
+    assert error in results[1].error
+    assert repository.get_wallets(1) == {'USD': 100000.0}
+    assert repository.get_wallets(2) == {'BTC': 1.0}
+
+
+def test_non_atomic_batch_applies_valid_orders(repository):
+    results = execute_orders([
+        Order(1, 'buy', 'BTC', 1.0),
+        Order(1, 'buy', 'BTC', 1.5),   # после первого ордера USD не хватает
+        Order('abc', 'buy', 'BTC', 1.0),
+        Order(2, 'sell', 'BTC', 1.0),
+    ], atomic=False)
+
+    assert [result.ok for result in results] == [True, False, False, True]
+    assert repository.get_wallets(1) == {'USD': 50000.0, 'BTC': 1.0}
+    assert repository.get_wallets(2) == {'BTC': 0.0, 'USD': 50000.0}
@@ -0,0 +1,279 @@
+import json
+import os
+
+import pytest
+
+from valutatrade_hub.infra import sharding
+from valutatrade_hub.infra.database import JsonPortfolioRepository, SQLiteRepository
+from valutatrade_hub.infra.journal import JournalPortfolioRepository
+from valutatrade_hub.infra.sharding import ShardedPortfolioRepository
+from valutatrade_hub.infra.store import BufferedPortfolioRepository, PortfolioStore
+
+
+def open_json(tmp_path):
+    return JsonPortfolioRepository(str(tmp_path / 'portfolios.json'))
+
+
+def open_sqlite(tmp_path):
+    return SQLiteRepository(str(tmp_path / 'valutatrade.db'))
+
+
+def open_journal(tmp_path, compact_every=1000):
+    return JournalPortfolioRepository(
+        snapshot_path=str(tmp_path / 'portfolios.snapshot.json'),
+        journal_path=str(tmp_path / 'portfolios.journal.jsonl'),
+        seed_path=str(tmp_path / 'portfolios.json'),
+        compact_every=compact_every,
+        fsync=False,
+    )
+
+
+def open_sharded(tmp_path):
+    return ShardedPortfolioRepository(str(tmp_path / 'portfolios'), buckets=8,
+                                      seed_path=str(tmp_path / 'portfolios.json'))
+
+
+def open_memory(tmp_path):
+    return PortfolioStore(str(tmp_path / 'portfolios.json'), flush_interval=0, flush_dirty=1000)
+
+
+BACKENDS = {
+    'json': open_json,
+    'sqlite': open_sqlite,
+    'journal': open_journal,
+    'sharded': open_sharded,
+    'memory': open_memory,
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def open_repository(request, tmp_path):
+    return lambda: BACKENDS[request.param](tmp_path)
+
+
+# Все хранилища
+
+def test_round_trip(open_repository):
+    repository = open_repository()
+    repository.create_portfolio(1, {'USD': 100.0})
+    repository.create_portfolios_batch({2: {'USD': 10.0}, 3: {'EUR': 5.0}})
+    repository.apply_deltas(1, {'USD': -40.0, 'BTC': 0.5})
+    repository.apply_deltas_batch({2: {'USD': -10.0, 'ETH': 2.0}, 3: {'EUR': 1.0}})
+    repository.close()
+
+    repository = open_repository()
+    assert repository.get_wallets(1) == {'USD': 60.0, 'BTC': 0.5}
+    assert repository.get_wallets(2) == {'USD': 0.0, 'ETH': 2.0}
+    assert repository.get_balance(3, 'EUR') == 6.0
+    assert repository.get_wallets(4) == {}
+    assert sorted(repository.iter_wallets()) == [
+        (1, 'BTC', 0.5), (1, 'USD', 60.0), (2, 'ETH', 2.0), (2, 'USD', 0.0), (3, 'EUR', 6.0),
+    ]
+    repository.close()
+
+
+def test_create_portfolio_twice_keeps_one_entry(open_repository):
+    repository = open_repository()
+    repository.create_portfolio(1, {'USD': 100.0})
+    repository.create_portfolio(1, {'USD': 50.0, 'EUR': 1.0})
+    repository.close()
+
+    repository = open_repository()
+    assert sorted(repository.iter_wallets()) == [(1, 'EUR', 1.0), (1, 'USD', 50.0)]
+    repository.close()
+
+
+# SQLite
+
+def test_sqlite_register_user_is_one_transaction(tmp_path):
+    repository = open_sqlite(tmp_path)
+    user_id = repository.register_user('alice', 'hash', '2026-01-01', {'USD': 105000.0})
+    assert repository.get_by_id(user_id)['username'] == 'alice'
+    assert repository.get_wallets(user_id) == {'USD': 105000.0}
+
+    # Ошибка в кошельках откатывает и пользователя
+    with pytest.raises(ValueError):
+        repository.register_user('bob', 'hash', '2026-01-01', {'USD': 'много'})
+    assert repository.get_by_username('bob') is None
+
+    # Занятое имя не оставляет кошельков
+    with pytest.raises(Exception):
+        repository.register_user('alice', 'hash', '2026-01-01', {'USD': 1.0})
+    assert sorted(repository.iter_wallets()) == [(user_id, 'USD', 105000.0)]
+    repository.close()
+
+
+def test_sqlite_rejects_overdraft_and_rolls_back_batch(tmp_path):
+    repository = open_sqlite(tmp_path)
+    repository.create_portfolios_batch({1: {'USD': 100.0, 'BTC': 1.0}, 2: {'USD': 10.0}})
+
+    with pytest.raises(ValueError, match="Недостаточно средств"):
+        repository.apply_deltas(1, {'USD': 50.0, 'BTC': -1.5})
+    with pytest.raises(ValueError, match="Недостаточно средств"):
+        repository.apply_deltas_batch({1: {'USD': -100.0}, 2: {'USD': -20.0}})
+    with pytest.raises(ValueError, match="Недостаточно средств"):
+        repository.apply_deltas(2, {'EUR': -1.0})
+
+    assert repository.get_wallets(1) == {'USD': 100.0, 'BTC': 1.0}
+    assert repository.get_wallets(2) == {'USD': 10.0}
+
+    repository.apply_deltas(1, {'BTC': -1.0, 'USD': 91000.0})
+    assert repository.get_wallets(1) == {'USD': 91100.0, 'BTC': 0.0}
+    repository.close()
+
+
+# Журнал
+
+def journal_lines(tmp_path):
+    with open(tmp_path / 'portfolios.journal.jsonl') as f:
+        return f.readlines()
+
+
+def test_journal_replays_after_crash_and_drops_torn_tail(tmp_path):
+    repository = open_journal(tmp_path)
+    repository.create_portfolio(1, {'USD': 100.0})
+    repository.apply_deltas(1, {'USD': -30.0, 'BTC': 0.1})
+    repository.apply_deltas_batch({1: {'BTC': 0.2}, 2: {'EUR': 7.0}})
+    # Процесс «упал»: close() не вызван, а последняя запись дописана наполовину
+    with open(tmp_path / 'portfolios.journal.jsonl', 'a') as f:
+        f.write('{"user_id": 1, "deltas": {"USD": -7')
+
+    recovered = open_journal(tmp_path)
+    assert recovered.get_wallets(1) == {'USD': 70.0, 'BTC': pytest.approx(0.3)}
+    assert recovered.get_wallets(2) == {'EUR': 7.0}
+    assert len(journal_lines(tmp_path)) == 3
+
+    # После обрезки хвоста журнал пишется дальше как обычно
+    recovered.apply_deltas(2, {'EUR': -2.0})
+    recovered.close()
+    assert open_journal(tmp_path).get_wallets(2) == {'EUR': 5.0}
+
+
+def test_journal_compaction(tmp_path):
+    repository = open_journal(tmp_path, compact_every=3)
+    repository.create_portfolio(1, {'USD': 100.0})
+    for _ in range(3):
+        repository.apply_deltas(1, {'USD': -10.0})
+
+    snapshot = json.loads((tmp_path / 'portfolios.snapshot.json').read_text())
+    assert snapshot['seq'] == 3
+    assert len(journal_lines(tmp_path)) == 1
+
+    reopened = open_journal(tmp_path, compact_every=3)
+    assert reopened.get_wallets(1) == {'USD': 70.0}
+
+
+def test_journal_skips_records_already_in_snapshot(tmp_path):
+    repository = open_journal(tmp_path)
+    repository.create_portfolio(1, {'USD': 100.0})
+    repository.apply_deltas(1, {'USD': -10.0})
+    old_journal = (tmp_path / 'portfolios.journal.jsonl').read_text()
+    repository.compact()
+    # Сбой между записью снимка и обрезкой журнала: старые записи остались
+    (tmp_path / 'portfolios.journal.jsonl').write_text(old_journal)
+
+    assert open_journal(tmp_path).get_wallets(1) == {'USD': 90.0}
+
+
+def test_journal_sees_writes_of_another_instance(tmp_path):
+    first = open_journal(tmp_path)
+    second = open_journal(tmp_path)
+    first.create_portfolio(1, {'USD': 100.0})
+    second.apply_deltas(1, {'USD': -25.0})
+    first.apply_deltas(1, {'USD': -25.0})
+    assert second.get_wallets(1) == {'USD': 50.0}
+
+
+# Шардирование
+
+def shard_files(tmp_path):
+    root = tmp_path / 'portfolios'
+    return sorted(str(path.relative_to(root)) for path in root.rglob('*') if path.is_file()
+                  and not path.name.endswith('.lock'))
+
+
+def test_sharded_batch_rolls_back_on_bad_delta(tmp_path):
+    repository = open_sharded(tmp_path)
+    repository.create_portfolios_batch({1: {'USD': 100.0}, 2: {'USD': 50.0}})
+    files = shard_files(tmp_path)
+
+    with pytest.raises(ValueError):
+        repository.apply_deltas_batch({1: {'USD': -10.0}, 2: {'USD': 'x'}, 3: {'USD': 1.0}})
+
+    assert repository.get_wallets(1) == {'USD': 100.0}
+    assert repository.get_wallets(2) == {'USD': 50.0}
+    assert repository.get_wallets(3) == {}
+    assert shard_files(tmp_path) == files
+
+
+def test_sharded_batch_rolls_back_on_replace_failure(tmp_path, monkeypatch):
+    repository = open_sharded(tmp_path)
+    repository.create_portfolios_batch({1: {'USD': 100.0}, 2: {'USD': 50.0}})
+    files = shard_files(tmp_path)
+
+    real_replace = os.replace
+    replaced = []
+
+    def flaky_replace(src, dst):
+        if str(src).endswith('.batch'):
+            replaced.append(dst)
+            if len(replaced) == 3:
+                raise OSError("диск недоступен")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(sharding.os, 'replace', flaky_replace)
+    with pytest.raises(OSError):
+        repository.apply_deltas_batch({1: {'USD': -10.0}, 4: {'EUR': 1.0}, 2: {'USD': -10.0}})
+    monkeypatch.undo()
+
+    assert len(replaced) == 3
+    assert repository.get_wallets(1) == {'USD': 100.0}
+    assert repository.get_wallets(2) == {'USD': 50.0}
+    assert repository.get_wallets(4) == {}
+    assert shard_files(tmp_path) == files
+
+
+def test_sharded_layout_is_seeded_from_portfolios_json(tmp_path):
+    (tmp_path / 'portfolios.json').write_text(json.dumps([
+        {'user_id': 1, 'wallets': {'USD': {'balance': 10.0}}},
+    ]))
+    repository = open_sharded(tmp_path)
+    assert repository.get_wallets(1) == {'USD': 10.0}
+    manifest = json.loads((tmp_path / 'portfolios' / 'manifest.json').read_text())
+    assert manifest['buckets'] == 8
+
+
+# Память и пакетный режим
+
+def test_memory_store_rejects_overdraft_without_partial_changes(tmp_path):
+    repository = open_memory(tmp_path)
+    repository.create_portfolios_batch({1: {'USD': 100.0}, 2: {'USD': 10.0}})
+    with pytest.raises(ValueError, match="Недостаточно средств"):
+        repository.apply_deltas_batch({1: {'USD': -50.0}, 2: {'USD': -20.0}})
+    assert repository.get_wallets(1) == {'USD': 100.0}
+    repository.close()
+
+
+def test_buffered_flush_failure_keeps_pending_changes(tmp_path, monkeypatch):
+    inner = open_sqlite(tmp_path)
+    inner.create_portfolio(1, {'USD': 100.0})
+    buffered = BufferedPortfolioRepository(inner)
+    buffered.create_portfolio(2, {'USD': 20.0})
+    buffered.apply_deltas(1, {'USD': -30.0, 'BTC': 0.5})
+
+    def failing_batch(batch):
+        raise OSError("диск недоступен")
+
+    monkeypatch.setattr(inner, 'apply_deltas_batch', failing_batch)
+    with pytest.raises(OSError):
+        buffered.flush()
+    # Новый портфель уже записан, приращения ждут следующего flush
+    assert inner.get_wallets(2) == {'USD': 20.0}
+    assert inner.get_wallets(1) == {'USD': 100.0}
+
+    monkeypatch.undo()
+    buffered.flush()
+    assert inner.get_wallets(1) == {'USD': 70.0, 'BTC': 0.5}
+    assert sorted(inner.iter_wallets()) == [(1, 'BTC', 0.5), (1, 'USD', 70.0), (2, 'USD', 20.0)]
+    assert buffered.commit_count == 1
+    inner.close()
@@ -1,27 +1,32 @@
 import argparse
+import contextlib
+import io
 import json
 import os
+import sys
+import time
 import hashlib
+from collections.abc import Mapping
 from datetime import datetime
-from valutatrade_hub.core import models
 from valutatrade_hub.core.exceptions import InsufficientFundsError,CurrencyNotFoundError,ApiRequestError,RatesCacheExpiredError
 from valutatrade_hub.infra import settings
-from valutatrade_hub.parser_service import updater
-from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
-from valutatrade_hub.parser_service import storage
+from valutatrade_hub.infra import rates_cache
 import logging
-# from logging_config import 
+# parser_service (и вместе с ним requests), core.models, core.rate_graph,
+# core.valuation, infra.database, infra.metrics, infra.tracing и logging_config
+# импортируются внутри команд и main(), которым они нужны: импорт модуля CLI
+# не должен их ждать (бюджет — scripts/check_import_time.py)
 
 # Глобальные переменные для текущей сессии
 current_user = None  # словарь с данными пользователя
 current_user_id = None
 
 config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
-USERS_FILE = config.get('path_to_json', 'data/users.json')
-PORTFOLIOS_FILE = config.get('path_to_json', 'data/portfolios.json')
 RATES_FILE = config.get('path_to_json', 'data/rates.json')
 
 ttl_seconds = config.get('rates_ttl_seconds', 3600)
+PROFILE_DIR = config.get('profile_dir', 'profiles')
+PROFILE_TOP = config.get('profile_top', 20)
 # USERS_FILE = 'data/users.json'
 # PORTFOLIOS_FILE = 'data/portfolios.json'
 # RATES_FILE = 'data/rates.json'
@@ -40,14 +45,14 @@ def hash_password(password, salt='somesalt'):
     return hashlib.sha256((password + salt).encode()).hexdigest()
 
 def register(args):
-    users = load_json(USERS_FILE)
-    portfolios = load_json(PORTFOLIOS_FILE)
+    from valutatrade_hub.infra import database
+    users = database.get_user_repository()
 
     username = args.username
     password = args.password
 
     # Проверка уникальности username
-    if any(u['username'] == username for u in users):
+    if users.get_by_username(username) is not None:
         print(f"Имя пользователя '{username}' уже занято")
         return
 
@@ -55,45 +60,22 @@ def register(args):
         print("Пароль должен быть не короче 4 символов")
         return
 
-    # Генерация user_id
-    # print(users[0])
-    user_id = (len(users)) if users else 1
-
     hashed_pw = hash_password(password)
-    user_data = {
-        'user_id': user_id,
-        'username': username,
-        'hashed_password': hashed_pw,
-        'registration_date': str(datetime.datetime.now())
-    }
-    users.append(user_data)
-
-    # Создать портфель
-    portfolios.append({
-        'user_id': user_id,
-        'wallets': {
-   "USD": {"balance": 105000.0}}
-    })
-    
-
-    save_json(USERS_FILE, users)
-    save_json(PORTFOLIOS_FILE, portfolios)
+    # Пользователь и стартовый портфель
+    user_id = database.register_user(username, hashed_pw, str(datetime.now()), {"USD": 105000.0})
 
     print(f"Пользователь '{username}' зарегистрирован (id={user_id}). Войдите: login --username {username} --password ****")
 
 
 def login(args):
     global current_user, current_user_id
-    users = load_json(USERS_FILE)
+    from valutatrade_hub.infra import database
+    users = database.get_user_repository()
 
     username = args.username
     password = args.password
 
-    user_entry = None
-    for u in users:
-        if u['username'] == username:
-            user_entry = u
-            break
+    user_entry = users.get_by_username(username)
 
     if not user_entry:
         print(f"Пользователь '{username}' не найден")
@@ -115,32 +97,24 @@ def show_portfolio(args):
         print("Сначала выполните login")
         return
 
-    portfolios = load_json(PORTFOLIOS_FILE)
-    user_wallet_info = next(filter(lambda w: w['user_id'] == int(current_user_id), portfolios), None)
-    wallets = user_wallet_info["wallets"]
-    user_portfolio = wallets
-    if not user_portfolio:
-        print("Портфель не найден")
-        return
-
-    wallets = user_wallet_info.get('wallets', {})
+    from valutatrade_hub.core.rate_graph import get_rate_graph
+    from valutatrade_hub.infra import database
+    wallets = database.get_portfolio_repository().get_wallets(int(current_user_id))
     if not wallets:
         print("У вас нет кошельков")
         return
 
     base = args.base or 'USD'
-    rates = load_json(RATES_FILE)
+    rates = rates_cache.get_rates(RATES_FILE)
 
     # Проверка курса
-    matching_item = next((item for item in rates.keys() if item.find(base) != -1), None)
-    if matching_item ==-1:
+    if base not in get_rate_graph(rates):
         print(f"Неизвестная базовая валюта '{base}'")
         return
 
     total_value = 0.0
     print(f"Портфель пользователя '{current_user['username']}' (база: {base}):")
-    for code, data in wallets.items():
-        balance = data['balance']
+    for code, balance in wallets.items():
         try:
             rate = get_exchange_rate_static(code, base, rates)
         except CurrencyNotFoundError as e:
@@ -163,26 +137,14 @@ def show_portfolio(args):
     print(f"ИТОГО: {total_value:.2f} {base}")
 
 def get_exchange_rate_static(from_code, to_code, rates):
-    # Временная функция для получения курса из кеша rates.json
-    # с учетом возможных обратных курсов.
+    # Курс из кеша rates.json: прямой, обратный или кросс-курс
+    # через опорную валюту (матрица конверсии, см. core/rate_graph.py).
     if from_code == to_code:
         return 1.0
-    else:
-        try:
-            pairs = rates.get('pairs')
-            if not pairs:
-                raise CurrencyNotFoundError(f"Пары не найдены в данных: {rates}")
-            pair_key = f"{from_code}_{to_code}"
-            pair_data = pairs.get(pair_key)
-            if not pair_data:
-                raise CurrencyNotFoundError(f"Курс для пары {pair_key} не найден")
-            rate = pair_data.get('rate')
-            if rate is None:
-                raise CurrencyNotFoundError(f"Курс для пары {pair_key} отсутствует")
-            return rate
-        except AttributeError:
-            # Если rates.get('pairs') возвращает None, либо не словарь
-            raise CurrencyNotFoundError(f"Некорректные данные для курса: {rates}")
+    if not isinstance(rates, Mapping) or not rates.get('pairs'):
+        raise CurrencyNotFoundError(f"{from_code}_{to_code}")
+    from valutatrade_hub.core.rate_graph import get_rate_graph
+    return get_rate_graph(rates).rate(from_code, to_code)
 
 
 
@@ -199,11 +161,11 @@ def buy(args):
         return
 
     try:
-        portfolios = load_json(PORTFOLIOS_FILE)
-        portfolio = models.Portfolio(current_user_id, current_user, portfolios)
+        from valutatrade_hub.core import models
+        portfolio = models.Portfolio(current_user_id, current_user)
         portfolio.buy_currency(currency, amount)
 
-        rate = get_exchange_rate_static(currency, 'USD', load_json(RATES_FILE))
+        rate = get_exchange_rate_static(currency, 'USD', rates_cache.get_rates(RATES_FILE))
         if rate is None:
             print(f"Не удалось получить курс для {currency}")
             return
@@ -231,11 +193,11 @@ def sell(args):
         return
 
     try:
-        portfolios = load_json(PORTFOLIOS_FILE)
-        portfolio = models.Portfolio(current_user_id, current_user, portfolios)
+        from valutatrade_hub.core import models
+        portfolio = models.Portfolio(current_user_id, current_user)
         portfolio.sell_currency(currency, amount)
 
-        rate = get_exchange_rate_static(currency, 'USD', load_json(RATES_FILE))
+        rate = get_exchange_rate_static(currency, 'USD', rates_cache.get_rates(RATES_FILE))
         if rate is None:
             print(f"Не удалось получить курс для {currency}")
             return
@@ -256,7 +218,10 @@ def get_rate(args):
     try:
         from_code = args.from_.upper()
         to_code = args.to.upper()
-        rates = load_json(RATES_FILE)
+        if args.at:
+            get_rate_at(from_code, to_code, args.at)
+            return
+        rates = rates_cache.get_rates(RATES_FILE)
         rate = get_exchange_rate_static(from_code, to_code, rates)
         if rate is None:
             print(f"Курс {from_code}→{to_code} недоступен. Повторите попытку позже.")
@@ -277,9 +242,85 @@ def get_rate(args):
         logger.error(f"Ошибка при получении курса {args.from_}→{args.to}: {str(e)}")
     
 
+def get_rate_at(from_code, to_code, at):
+    # Курс на момент времени из истории
+    from valutatrade_hub.parser_service import storage
+    record = storage.get_rate_at(from_code, to_code, at)
+    if record is None:
+        print(f"Нет данных по курсу {from_code}→{to_code} на {at}")
+        return
+    print(f"Курс {from_code}→{to_code} на {at}: {record['rate']:.6f} (замер: {record['timestamp']}, источник: {record.get('source', 'неизвестно')})")
+
+def command_rate_history(args):
+    from_code = args.from_.upper()
+    to_code = args.to.upper()
+    from valutatrade_hub.parser_service import storage
+    try:
+        count = 0
+        for record in storage.iter_rate_history(from_code, to_code, args.start, args.end):
+            if args.limit and count >= args.limit:
+                break
+            print(f"- {record['timestamp']}: {record['rate']:.6f} ({record.get('source', '')})")
+            count += 1
+        if count == 0:
+            print(f"История курса {from_code}→{to_code} за указанный период пуста.")
+    except ValueError as e:
+        print(f"Некорректная дата: {str(e)}")
+
+def command_valuation_report(args):
+    # Оценка всех портфелей разом (для администратора)
+    from valutatrade_hub.core import valuation
+    from valutatrade_hub.core.rate_graph import get_rate_graph
+    from valutatrade_hub.infra import database
+    base = (args.base or 'USD').upper()
+    rates = rates_cache.get_rates(RATES_FILE)
+    data = valuation.load_wallet_arrays(database.get_portfolio_repository())
+    try:
+        report = valuation.value_all(data, get_rate_graph(rates), base)
+    except ValueError as e:
+        print(f"Ошибка: {str(e)}")
+        return
+
+    print(f"Оценка портфелей (база: {base}, курсы от {rates.get('last_refresh', 'неизвестно')}):")
+    print(f"Пользователей: {len(report.user_ids)}, кошельков: {len(data.balances)}")
+    print(f"Всего активов: {report.total_aum:.2f} {base}")
+    print("Крупнейшие портфели:")
+    for user_id, total in report.top_users(args.top):
+        print(f"- user_id={user_id}: {total:.2f} {base}")
+    print("Позиции по валютам:")
+    for code, value in sorted(report.exposure.items(), key=lambda item: item[1], reverse=True):
+        print(f"- {code}: {value:.2f} {base}")
+    if report.missing_rates:
+        print(f"Нет курса (не учтены): {', '.join(report.missing_rates)}")
+
+def command_provider_stats(args):
+    from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
+    from valutatrade_hub.parser_service.provider_stats import provider_stats
+    from valutatrade_hub.parser_service.rate_limiter import get_bucket
+    summaries = provider_stats.summaries()
+    if not summaries:
+        print("Статистика запросов пуста. Выполните 'update-rates'.")
+    else:
+        print("Задержки провайдеров (скользящее окно последних запросов):")
+    for name, s in sorted(summaries.items()):
+        print(f"- {name}: запросов={s['count']} ошибок={s['errors']} повторов={s['retries']} "
+              f"p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms p99={s['p99_ms']:.1f}ms "
+              f"max={s['max_ms']:.1f}ms ответ≈{s['avg_payload_bytes']} байт "
+              f"ожидание лимитера≈{s.get('avg_limiter_wait_ms', 0.0):.1f}ms "
+              f"паузы повторов≈{s.get('avg_backoff_ms', 0.0):.1f}ms")
+
+    print("Лимиты запросов:")
+    for client_cls in (CoinGeckoClient, ExchangeRateApiClient):
+        status = get_bucket(client_cls.__name__, client_cls.RATE_LIMIT, client_cls.QUOTA).status()
+        print(f"- {client_cls.__name__}: токенов {status['tokens']}/{status['capacity']}, "
+              f"квота {status['quota_remaining']}/{status['quota']} "
+              f"(сброс через {status['quota_resets_in'] / 3600:.1f} ч)")
+
 def command_update_rates(args):
     print("INFO: Starting rates update...")
     try:
+        from valutatrade_hub.parser_service import storage, updater
+        from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
         # Инициализация клиентов
         clients = []
         if args.source is None or args.source.lower() == 'coingecko':
@@ -303,7 +344,7 @@ def command_show_rates(args):
         print("Локальный кеш курсов пуст. Выполните 'update-rates', чтобы загрузить данные.")
         return
 
-    rates_data = load_json(rates_path)
+    rates_data = rates_cache.get_rates(rates_path)
     if not rates_data:
         print("Кеш пуст или не содержит данных.")
         return
@@ -345,8 +386,8 @@ def command_show_rates(args):
         print(f"- {key}: {data:.2f}")
         count += 1
 # Настройка argparse
-def main():
-# Создаем парсер один раз
+def build_parser():
+    # Создаем парсер один раз
     parser = argparse.ArgumentParser(description='Crypto Portfolio CLI')
     subparsers = parser.add_subparsers(dest='command')
 
@@ -378,6 +419,15 @@ def main():
     parser_rate = subparsers.add_parser('get-rate', help='Получить курс валюты')
     parser_rate.add_argument('--from', dest='from_', required=True)
     parser_rate.add_argument('--to', required=True)
+    parser_rate.add_argument('--at', help='Момент времени ISO 8601, например 2026-01-09T04:00Z')
+
+    # rate-history
+    parser_history = subparsers.add_parser('rate-history', help='История курса за период')
+    parser_history.add_argument('--from', dest='from_', required=True)
+    parser_history.add_argument('--to', required=True)
+    parser_history.add_argument('--start', help='Начало периода (ISO 8601)')
+    parser_history.add_argument('--end', help='Конец периода (ISO 8601)')
+    parser_history.add_argument('--limit', type=int, help='Показать не более N записей')
     
     # add update-rates
     parser_update = subparsers.add_parser('update-rates', help='Обновить курсы валют')
@@ -388,16 +438,179 @@ def main():
     parser_show_rates.add_argument('--currency', type=str, help='Фильтр по валюте (например BTC)')
     parser_show_rates.add_argument('--top', type=int, help='Показать N самых дорогих')
     parser_show_rates.add_argument('--base', type=str, default='USD', help='Базовая валюта (по умолчанию USD)')
+    # provider-stats
+    subparsers.add_parser('provider-stats', help='Задержки и ошибки внешних API')
+
+    # valuation-report
+    parser_valuation = subparsers.add_parser('valuation-report', help='Оценка всех портфелей (администратор)')
+    parser_valuation.add_argument('--base', type=str, default='USD', help='Базовая валюта (по умолчанию USD)')
+    parser_valuation.add_argument('--top', type=int, default=10, help='Показать N крупнейших портфелей')
     # exit
     parser_exit = subparsers.add_parser('exit', help='Выйти из программы')
     parser_exit.add_argument('--quit', action='store_true', help='Выйти из программы')
 
+    # --profile доступен у каждой команды, например: show-portfolio --profile
+    for name, command_parser in subparsers.choices.items():
+        if name != 'exit':
+            command_parser.add_argument('--profile', action='store_true',
+                                        help='Выполнить команду под cProfile и показать самые долгие функции')
+    return parser
+
+
+def dispatch(args):
+    # Вызов функций
+    if args.command == 'register':
+        register(args)
+    elif args.command == 'login':
+        login(args)
+    elif args.command == 'show-portfolio':
+        show_portfolio(args)
+    elif args.command == 'buy':
+        buy(args)
+    elif args.command == 'sell':
+        sell(args)
+    elif args.command == 'get-rate':
+        get_rate(args)
+    elif args.command == 'update-rates':
+        command_update_rates(args)
+    elif args.command == 'show-rates':
+        command_show_rates(args)
+    elif args.command == 'rate-history':
+        command_rate_history(args)
+    elif args.command == 'valuation-report':
+        command_valuation_report(args)
+    elif args.command == 'provider-stats':
+        command_provider_stats(args)
+
+
+def run_profiled(name, func, *args, top=None):
+    """
+    Выполняет func(*args) под cProfile, сохраняет профиль в PROFILE_DIR/<name>-<время>.prof
+    и печатает top функций по накопленному времени.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof")
+        profiler.dump_stats(path)
+        print(f"--- Профиль '{name}' сохранен в {path} (просмотр: python -m pstats {path}) ---")
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.sort_stats('cumulative').print_stats(top or PROFILE_TOP)
+
+
+def execute(args, profile=False, top=None):
+    # Команда с --profile (или все команды при глобальном --profile) выполняется под профилировщиком
+    from valutatrade_hub.infra import tracing
+    with tracing.span(f'cli.{args.command}'):
+        if profile or getattr(args, 'profile', False):
+            run_profiled(args.command, dispatch, args, top=top)
+        else:
+            dispatch(args)
+
+
+def read_script_lines(path):
+    # Команды из файла или из stdin ('-'); пустые строки и комментарии '#' пропускаются
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_script(parser, path, commit_every=None, quiet=False, profile_top=None):
+    """
+    Пакетный режим: выполняет команды из файла без интерактивного ввода.
+    Портфели загружаются один раз и сохраняются каждые commit_every операций
+    (0 — одним сохранением в конце), в конце печатается сводка.
+    """
+    from valutatrade_hub.infra import database
+    if commit_every is None:
+        commit_every = config.get('script_commit_every', 1000)
+    batch = database.begin_batch(commit_every)
+    executed = 0
+    rejected = 0
+    started = time.perf_counter()
+    try:
+        for line in read_script_lines(path):
+            try:
+                with contextlib.redirect_stderr(io.StringIO()):
+                    args = parser.parse_args(line.split())
+            except SystemExit:
+                rejected += 1
+                print(f"Некорректная команда: {line}")
+                continue
+            if args.command == 'exit':
+                break
+            if not args.command:
+                rejected += 1
+                continue
+            if quiet:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    execute(args, top=profile_top)
+            else:
+                execute(args, top=profile_top)
+            executed += 1
+    finally:
+        database.end_batch()
+        elapsed = time.perf_counter() - started
+    rate = executed / elapsed if elapsed > 0 else 0.0
+    print("---------------------------------")
+    print(f"Выполнено команд: {executed}, отклонено: {rejected}")
+    print(f"Изменений портфелей: {batch.operations}, сохранений: {batch.commit_count}")
+    print(f"Время: {elapsed:.3f} c, {rate:.1f} команд/с")
+
+
+def main(argv=None):
+    cli = argparse.ArgumentParser(description='Crypto Portfolio CLI')
+    cli.add_argument('--script', metavar='FILE', help="Выполнить команды из файла ('-' — из stdin)")
+    cli.add_argument('--commit-every', type=int, default=None,
+                     help='Сохранять портфели каждые N операций (0 — один раз в конце)')
+    cli.add_argument('--quiet', action='store_true', help='Не печатать вывод отдельных команд')
+    cli.add_argument('--profile', action='store_true',
+                     help='Профилировать команды (в режиме --script — весь скрипт целиком)')
+    cli.add_argument('--profile-top', type=int, default=None,
+                     help=f'Сколько функций показать в профиле (по умолчанию {PROFILE_TOP})')
+    cli.add_argument('--trace', nargs='?', const='', default=None, metavar='FILE',
+                     help='Записывать спаны трассировки в JSONL (по умолчанию tracing_path)')
+    options = cli.parse_args(argv)
+
+    from valutatrade_hub.infra import database, metrics, tracing
+    if options.trace is not None:
+        tracing.enable(options.trace or None)
+    # Журнал действий пишется в фоне и не задерживает команды
+    from valutatrade_hub import logging_config
+    logging_config.setup_logging()
+    # Метрики процесса выгружаются в textfile для node_exporter
+    metrics.start_exporter()
+    parser = build_parser()
+    if options.script:
+        try:
+            if options.profile:
+                run_profiled('script', run_script, parser, options.script, options.commit_every,
+                             options.quiet, top=options.profile_top)
+            else:
+                run_script(parser, options.script, options.commit_every, options.quiet,
+                           profile_top=options.profile_top)
+        finally:
+            database.close_repositories()
+        return
+
     while True:
         try:
             user_input = input("Введите команду (или 'exit' для выхода): ")  # читаем строку
             args = parser.parse_args(user_input.split())
 
             if args.command == 'exit':
+                database.close_repositories()
                 print("Выход из программы.")
                 break
 
@@ -405,23 +618,7 @@ def main():
                 print("Некорректная команда. Попробуйте снова.")
                 continue
 
-            # Вызов функций
-            if args.command == 'register':
-                register(args)
-            elif args.command == 'login':
-                login(args)
-            elif args.command == 'show-portfolio':
-                show_portfolio(args)
-            elif args.command == 'buy':
-                buy(args)
-            elif args.command == 'sell':
-                sell(args)
-            elif args.command == 'get-rate':
-                get_rate(args)
-            elif args.command == 'update-rates':
-                command_update_rates(args)
-            elif args.command == 'show-rates':
-                command_show_rates(args)
+            execute(args, options.profile, options.profile_top)
 
         except SystemExit:
             # Это чтобы parser не завершал программу при неправильном вводе
@@ -1,6 +1,10 @@
-from exceptions import InsufficientFundsError, CurrencyNotFoundError, ApiRequestError
+import sys
+import threading
+from .exceptions import InsufficientFundsError, CurrencyNotFoundError, ApiRequestError
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
+from collections.abc import Mapping
+from types import MappingProxyType
 
 # Реестр валют (фабрика)
 currencies = {}
@@ -58,14 +62,150 @@ class CryptoCurrency(Currency):
 
 
 
-    def register_currency(currency: Currency):
-        """Добавляет валюту в реестр."""
-        currencies[currency.code] = currency
+def register_currency(currency: Currency):
+    """Добавляет валюту в реестр."""
+    currencies[currency.code] = currency
+
+def get_currency(code: str) -> Currency:
+    """Возвращает валюту по коду, или выбрасывает исключение."""
+    code_upper = code.upper()
+    if code_upper not in currencies:
+        raise CurrencyNotFoundError(code_upper)
+    return currencies[code_upper]
+
+
+# Описания валют по умолчанию для реестра currencies
+FIAT_INFO = {
+    "USD": ("US Dollar", "United States"),
+    "EUR": ("Euro", "Eurozone"),
+    "GBP": ("British Pound", "United Kingdom"),
+    "RUB": ("Russian Ruble", "Russia"),
+}
+CRYPTO_INFO = {
+    "BTC": ("Bitcoin", "SHA-256", 1.12e12),
+    "ETH": ("Ethereum", "Ethash", 4.5e11),
+    "SOL": ("Solana", "Proof of History", 7.7e10),
+}
+
+
+class CurrencyCatalog:
+    """
+    Неизменяемый справочник валют: код -> плотный id (0..size-1).
+
+    Id пары — from_id * size + to_id; это же смещение курса в матрице
+    RateGraph. Id пар действительны только для своего справочника
+    (после extended() размер другой). Таблицы ключей "FROM_TO" строятся
+    один раз при первом обращении, дальше строки пар не собираются заново.
+    """
+
+    __slots__ = ('codes', 'ids', 'size', '_pair_keys', '_pair_ids')
+
+    def __init__(self, codes):
+        unique = []
+        seen = set()
+        for code in codes:
+            code = sys.intern(code.strip().upper())
+            if code and code not in seen:
+                seen.add(code)
+                unique.append(code)
+        set_attr = object.__setattr__
+        set_attr(self, 'codes', tuple(unique))
+        set_attr(self, 'ids', MappingProxyType({code: i for i, code in enumerate(unique)}))
+        set_attr(self, 'size', len(unique))
+        set_attr(self, '_pair_keys', None)
+        set_attr(self, '_pair_ids', None)
+
+    @property
+    def pair_keys(self) -> tuple:
+        """pair_id -> ключ пары FROM_TO."""
+        if self._pair_keys is None:
+            codes = self.codes
+            object.__setattr__(self, '_pair_keys', tuple(f"{a}_{b}" for a in codes for b in codes))
+        return self._pair_keys
+
+    @property
+    def pair_ids(self) -> Mapping:
+        """Ключ пары FROM_TO -> pair_id."""
+        if self._pair_ids is None:
+            object.__setattr__(self, '_pair_ids',
+                               MappingProxyType({key: i for i, key in enumerate(self.pair_keys)}))
+        return self._pair_ids
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CurrencyCatalog неизменяем")
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.ids
+
+    def __len__(self):
+        return self.size
+
+    def id(self, code: str) -> int:
+        """Id валюты; неизвестный код — CurrencyNotFoundError."""
+        currency_id = self.ids.get(code)
+        if currency_id is None:
+            currency_id = self.ids.get(code.upper())
+            if currency_id is None:
+                raise CurrencyNotFoundError(code)
+        return currency_id
+
+    def pair_id(self, from_code: str, to_code: str) -> int:
+        return self.id(from_code) * self.size + self.id(to_code)
+
+    def pair_key(self, pair_id: int) -> str:
+        return self.pair_keys[pair_id]
+
+    def split_pair(self, pair_id: int):
+        """(from_id, to_id) по id пары."""
+        return divmod(pair_id, self.size)
+
+    def extended(self, codes) -> 'CurrencyCatalog':
+        """Справочник с добавленными в конец новыми кодами; id прежних кодов не меняются."""
+        new_codes = [code for code in codes if code.upper() not in self.ids]
+        if not new_codes:
+            return self
+        return CurrencyCatalog(self.codes + tuple(new_codes))
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> CurrencyCatalog:
+    """
+    Справочник процесса; строится один раз из ParserConfig: базовая валюта,
+    FIAT_CURRENCIES, CRYPTO_CURRENCIES и коды ExchangeRate-API.
+    """
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            # Импорт здесь, чтобы parser_service не загружался при старте CLI
+            from valutatrade_hub.parser_service.config import ParserConfig
+            parser_config = ParserConfig()
+            _catalog = CurrencyCatalog((parser_config.BASE_CURRENCY,)
+                                       + tuple(parser_config.FIAT_CURRENCIES)
+                                       + tuple(parser_config.CRYPTO_CURRENCIES)
+                                       + tuple(parser_config.EXCHANGERATE_CODES))
+            for code in _catalog.codes:
+                if code in FIAT_INFO and code not in currencies:
+                    register_currency(FiatCurrency(FIAT_INFO[code][0], code, FIAT_INFO[code][1]))
+                elif code in CRYPTO_INFO and code not in currencies:
+                    name, algorithm, market_cap = CRYPTO_INFO[code]
+                    register_currency(CryptoCurrency(name, code, algorithm, market_cap))
+        return _catalog
 
-    def get_currency(code: str) -> Currency:
-        """Возвращает валюту по коду, или выбрасывает исключение."""
-        code_upper = code.upper()
-        if code_upper not in currencies:
-            raise CurrencyNotFoundError(f"Currency with code '{code}' not found")
-        return currencies[code_upper]       
 
+def extend_catalog(codes) -> CurrencyCatalog:
+    """
+    Добавляет в справочник процесса коды, которых в нем нет (например, новые
+    пары из rates.json). Уже выданные справочники не меняются.
+    """
+    global _catalog
+    catalog = get_catalog()
+    if all(code in catalog.ids for code in codes):
+        return catalog
+    with _catalog_lock:
+        _catalog = _catalog.extended(codes)
+        return _catalog
@@ -17,4 +17,10 @@ class ApiRequestError(Exception):
 
 class RatesCacheExpiredError(Exception):
     def __init__(self, message: str):
-        super().__init__(f"Кэш курсов устарел или отсутствует: {message}")
\ No newline at end of file
+        super().__init__(f"Кэш курсов устарел или отсутствует: {message}")
+
+class OrderBatchError(Exception):
+    def __init__(self, results):
+        self.results = results
+        failed = [r for r in results if not r.ok]
+        super().__init__(f"Пакет ордеров отклонен: {len(failed)} из {len(results)} не прошли проверку")
@@ -8,24 +8,18 @@ import json
 import os
 from abc import ABC, abstractmethod
 from .exceptions import InsufficientFundsError, CurrencyNotFoundError, ApiRequestError
+from .rate_graph import get_rate_graph
+from ..decorators import log_action
 import threading
 from valutatrade_hub.infra import settings
-
-def save_json(file_path, data):
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+from valutatrade_hub.infra import database
+from valutatrade_hub.infra import rates_cache
+from valutatrade_hub.infra import tracing
 
 config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
 
-PORTFOLIOS_FILE = config.get('path_to_json', 'data/portfolios.json')
 RATES_FILE = config.get('path_to_json', 'data/rates.json')
 
-def load_json(file_path):
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    return {}
-
 
 
 @dataclass
@@ -80,6 +74,24 @@ class User:
         # Простое одностороннее хеширование
         return hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
 
+# Проверки сумм общие для Wallet и WalletTable (core/wallet_table.py)
+
+def check_deposit(amount):
+    if not isinstance(amount, (int, float)):
+        raise TypeError("Сумма пополнения должна быть числом.")
+    if amount <= 0:
+        raise ValueError("Сумма пополнения должна быть положительной.")
+
+
+def check_withdraw(amount, balance: float):
+    if not isinstance(amount, (int, float)):
+        raise TypeError("Сумма снятия должна быть числом.")
+    if amount <= 0:
+        raise ValueError("Сумма снятия должна быть положительной.")
+    if amount > balance:
+        raise ValueError("Недостаточно средств на балансе.")
+
+
 @dataclass
 class Wallet:
     def __init__(self, currency_code: str, balance: float = 0.0):
@@ -99,38 +111,33 @@ class Wallet:
         self._balance = float(value)
 
     def deposit(self, amount: float):
-        if not isinstance(amount, (int, float)):
-            raise TypeError("Сумма пополнения должна быть числом.")
-        if amount <= 0:
-            raise ValueError("Сумма пополнения должна быть положительной.")
+        check_deposit(amount)
         self._balance += amount
 
     def withdraw(self, amount: float):
-        if not isinstance(amount, (int, float)):
-            raise TypeError("Сумма снятия должна быть числом.")
-        if amount <= 0:
-            raise ValueError("Сумма снятия должна быть положительной.")
-        if amount > self._balance:
-            raise ValueError("Недостаточно средств на балансе.")
-        # print(self._balance)
+        check_withdraw(amount, self._balance)
         self._balance -= amount
-        # print(self._balance)
 
     def get_balance_info(self):
         return {
             "currency_code": self.currency_code,
             "balance": self._balance
         }
+
+
 # vaultatrade_hub/core/models.py
 
 class Portfolio:
-    # Фиктивные курсы валют для конвертации
-    rates = load_json(RATES_FILE)
+    @property
+    def rates(self):
+        # Актуальный снимок rates.json (перечитывается только при изменении файла)
+        return rates_cache.get_rates(RATES_FILE)
 
-    def __init__(self, user_id: int, user, wallets=None):
-        self._user_id = user_id
+    def __init__(self, user_id: int, user, repository=None):
+        self._user_id = int(user_id)
         self._user = user  # объект пользователя
-        self._wallets = wallets if wallets is not None else {}
+        # Хранилище кошельков (infra/database.py)
+        self._repository = repository if repository is not None else database.get_portfolio_repository()
 
     @property
     def user(self):
@@ -138,140 +145,95 @@ class Portfolio:
 
     @property
     def wallets(self):
-        # возвращает копию словаря
-        return self._wallets.copy()
+        # возвращает новый словарь объектов Wallet
+        return {
+            code: Wallet(code, balance)
+            for code, balance in self._repository.get_wallets(self._user_id).items()
+        }
 
     def add_currency(self, currency_code: str):
-        if currency_code in self._wallets:
+        if self._repository.get_balance(self._user_id, currency_code) is not None:
             raise ValueError(f"Кошелек для {currency_code} уже существует.")
-        self._wallets[currency_code] = Wallet(currency_code)
-
+        self._repository.apply_deltas(self._user_id, {currency_code: 0.0})
 
     def get_wallet(self, user_id: int, currency_code: str):
-        wallets_list = self._wallets
-        user_wallet_info = next(filter(lambda w: w['user_id'] == int(self._user_id), wallets_list), None)
-        if user_wallet_info is None:
-            raise CurrencyNotFoundError("Пользовательский кошелек не найден.")
-        wallets = user_wallet_info['wallets']
-        # print(currency_code)
-        wallet_data = wallets.get(currency_code)
-        # print(wallet_data)
-        if wallet_data is None:
+        balance = self._repository.get_balance(self._user_id, currency_code)
+        if balance is None:
             raise CurrencyNotFoundError(f"Кошелек для валюты {currency_code} не найден.")
         # создать объект Wallet из данных
-        return Wallet(currency_code, wallet_data['balance'])
+        return Wallet(currency_code, balance)
 
     def get_total_value(self, base_currency='USD'):
-        if base_currency not in self.rates:
+        graph = get_rate_graph(self.rates)
+        if base_currency not in graph:
             raise ValueError(f"Курс для {base_currency} не определен.")
         total = 0.0
-        for wallet in self._wallets.values():
-            rate = self.rates.get(wallet.currency_code)
-            if rate is None:
+        for code, balance in self._repository.get_wallets(self._user_id).items():
+            rate = graph.rate_or_nan(code, base_currency)
+            if rate != rate:
                 continue  # пропускаем валюты без курса
-            # Конвертируем баланс в базовую валюту
-            total += wallet.balance * rate / self.rates[wallet.currency_code]
-        # В данном случае, поскольку rate уже в курсе относительно USD,
-        # можно просто умножить баланс на курс
+            total += balance * rate
         return total
+
+    def _get_usd_rate(self, currency_code: str) -> float:
+        return get_rate_graph(self.rates).rate(currency_code, 'USD')
+
+    @log_action('BUY_CURRENCY')
     def buy_currency(self, currency_code: str, amount: float):
+        with tracing.span('portfolio.buy', user_id=self._user_id, currency=currency_code, amount=amount):
+            return self._buy_currency(currency_code, amount)
+
+    def _buy_currency(self, currency_code: str, amount: float):
+        # Неизвестный код отклоняем по справочнику валют, не обращаясь к хранилищу
+        get_rate_graph(self.rates).catalog.id(currency_code)
         # Получаем объект кошелька USD
         usd_wallet = self.get_wallet(self._user_id, 'USD')
-        if usd_wallet is None:
-            raise ValueError("Отсутствует кошелек USD.")
         if amount <= 0:
             raise ValueError("Сумма покупки должна быть положительной.")
 
-        rate_info = self.rates.get("pairs").get(f"{currency_code}_USD")
-        if rate_info is None:
-            raise CurrencyNotFoundError(f"Курс для {currency_code} не найден.")
-        rate = rate_info.get('rate')
-        if rate is None:
-            raise CurrencyNotFoundError(f"Некорректный курс для {currency_code}.")
-
+        rate = self._get_usd_rate(currency_code)
         cost_in_usd = amount * rate
 
         if usd_wallet.balance < cost_in_usd:
-            raise InsufficientFundsError("Недостаточно средств на USD кошельке.")
+            raise InsufficientFundsError(usd_wallet.balance, 'USD', cost_in_usd)
 
-        # списываем USD
-        # print(f"Баланс USD до списания: {usd_wallet.balance}") #105000.0
+        # Проверяем операции на объектах Wallet, затем одной транзакцией
+        # списываем USD и зачисляем валюту
         usd_wallet.withdraw(cost_in_usd)
-        # print(f"Баланс USD после списания: {usd_wallet.balance}") #104821.98837
-        # print(self._wallets) #[{'user_id': 1, 'wallets': {'USD': {'balance': 105000.0}, 'BTC': {'balance': 8.06202}, 'EUR': {'balance': 20.0}}}]
-        for user_wallet in self._wallets:
-            if user_wallet['user_id'] == int(self._user_id):
-                user_wallet['wallets']['USD']['balance'] = usd_wallet.balance
-                break
-
-        save_json(PORTFOLIOS_FILE, self._wallets)  # сохраняем после списания
-
-        # добавляем валюту в кошелек пользователя
-        wallets_list = self._wallets
-        user_wallet_info = next(filter(lambda w: w['user_id'] == int(self._user_id), wallets_list), None)        
-        if user_wallet_info is None:
-            raise ValueError("Пользователь не найден.")
-
-        wallets = user_wallet_info['wallets']
-        # Обновляем баланс в структуре
-        if currency_code in wallets:
-            wallet_obj = Wallet(currency_code, wallets[currency_code]['balance'])
-            wallet_obj.deposit(amount)
-            wallets[currency_code]['balance'] = wallet_obj.balance
-        else:
-            new_wallet = Wallet(currency_code, 0)
-            new_wallet.deposit(amount)
-            wallets[currency_code] = {'balance': new_wallet.balance}        # Сохраняем изменения в файл
-        save_json(PORTFOLIOS_FILE, self._wallets)
+        Wallet(currency_code, 0).deposit(amount)
+        deltas = {'USD': -cost_in_usd}
+        deltas[currency_code] = deltas.get(currency_code, 0.0) + amount
+        self._repository.apply_deltas(self._user_id, deltas)
+        return {'rate': rate, 'usd_amount': cost_in_usd}
 
+    @log_action('SELL_CURRENCY')
     def sell_currency(self, currency_code: str, amount: float):
         """
         Продажа валюты: списание из кошелька валюты, зачисление в USD.
         """
+        with tracing.span('portfolio.sell', user_id=self._user_id, currency=currency_code, amount=amount):
+            return self._sell_currency(currency_code, amount)
+
+    def _sell_currency(self, currency_code: str, amount: float):
+        get_rate_graph(self.rates).catalog.id(currency_code)
         wallet = self.get_wallet(self._user_id, currency_code)
-        if wallet is None:
-            raise ValueError(f"Кошелек для {currency_code} не найден.")
         if amount <= 0:
             raise ValueError("Сумма продажи должна быть положительной.")
         if wallet.balance < amount:
-            raise InsufficientFundsError("Недостаточно средств в кошельке валюты.")
+            raise InsufficientFundsError(wallet.balance, currency_code, amount)
 
         # Получаем курс для обмена
-        rate_info = self.rates.get("pairs").get(f"{currency_code}_USD")
-        if rate_info is None:
-            raise CurrencyNotFoundError(f"Курс для {currency_code} не найден.")
-        rate = rate_info.get('rate')
-        if rate is None:
-            raise CurrencyNotFoundError(f"Некорректный курс для {currency_code}.")
+        rate = self._get_usd_rate(currency_code)
 
         # Рассчитываем сумму в USD
         amount_in_usd = amount * rate
 
-        # Списываем валюту из кошелька
+        # Списание валюты и зачисление USD — одна атомарная операция
         wallet.withdraw(amount)
-
-        # Обновляем баланс этой валюты в self._wallets
-        for user_wallet in self._wallets:
-            if user_wallet['user_id'] == int(self._user_id):
-                user_wallet['wallets'][currency_code]['balance'] = wallet.balance
-                break
-
-        # Обновляем баланс USD
-        usd_wallet = self.get_wallet(self._user_id, 'USD')
-        if usd_wallet is None:
-            self.add_currency('USD')
-            usd_wallet = self.get_wallet(self._user_id, 'USD')
-
-        usd_wallet.deposit(amount_in_usd)
-
-        # Обновляем баланс USD в self._wallets
-        for user_wallet in self._wallets:
-            if user_wallet['user_id'] == int(self._user_id):
-                user_wallet['wallets']['USD']['balance'] = usd_wallet.balance
-                break
-
-        # Сохраняем изменения
-        save_json(PORTFOLIOS_FILE, self._wallets)
+        deltas = {currency_code: -amount}
+        deltas['USD'] = deltas.get('USD', 0.0) + amount_in_usd
+        self._repository.apply_deltas(self._user_id, deltas)
+        return {'rate': rate, 'usd_amount': amount_in_usd}
 
 
 # # Исключение для неизвестных валют
@@ -283,4 +245,5 @@ class Portfolio:
 class Rate:
     currency_from: str
     currency_to: str
-    rate: float
\ No newline at end of file
+    rate: float
+
@@ -0,0 +1,165 @@
+# vaultatrade_hub/core/rate_graph.py
+
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from array import array
+from types import MappingProxyType
+from typing import Tuple
+
+from valutatrade_hub.infra import rates_cache
+
+from .currencies import CurrencyCatalog, extend_catalog
+from .exceptions import CurrencyNotFoundError
+
+NAN = float('nan')
+MAX_PIVOTS = 3  # сколько опорных валют пробовать для недостающих кросс-курсов
+
+
+class RateGraph:
+    """
+    Плотная матрица конверсии N×N по кешу rates.json.
+
+    Строки и столбцы — id валют из справочника CurrencyCatalog, поэтому курс
+    пары лежит по смещению pair_id = from_id * N + to_id. Прямые пары и
+    обратные к ним берутся из pairs, остальные кросс-курсы считаются через
+    опорную валюту с наибольшим числом известных курсов (обычно USD).
+    """
+
+    def __init__(self, pairs: dict, catalog: CurrencyCatalog = None):
+        codes = set()
+        edges = []
+        for key, data in pairs.items():
+            from_code, _, to_code = key.partition('_')
+            rate = data.get('rate') if isinstance(data, Mapping) else data
+            if not to_code or not rate:
+                continue
+            codes.update((from_code, to_code))
+            edges.append((from_code, to_code, float(rate)))
+
+        if catalog is None:
+            catalog = extend_catalog(codes)
+        else:
+            catalog = catalog.extended(codes)
+        self.catalog = catalog
+        self.codes: Tuple[str, ...] = catalog.codes
+        self.index: Mapping = catalog.ids
+        n = self.size = catalog.size
+        m = self.matrix = array('d', [NAN]) * (n * n)
+        self.known = bytearray(n)  # 1 — у валюты есть хотя бы один курс
+
+        for i in range(n):
+            m[i * n + i] = 1.0
+        ids = [(self.index[from_code], self.index[to_code], rate) for from_code, to_code, rate in edges]
+        for i, j, rate in ids:
+            m[i * n + j] = rate
+            self.known[i] = self.known[j] = 1
+        for i, j, rate in ids:
+            if m[j * n + i] != m[j * n + i]:  # NaN: обратного курса нет
+                m[j * n + i] = 1.0 / rate
+
+        self._fill_through_pivots()
+
+    def _fill_through_pivots(self):
+        n, m = self.size, self.matrix
+        # Валюты справочника без курсов пропускаем: их строки остаются NaN
+        rows = [i for i in range(n) if self.known[i]]
+        degree = {i: sum(1 for j in range(n) if m[i * n + j] == m[i * n + j]) for i in rows}
+        pivots = sorted(rows, key=lambda i: degree[i], reverse=True)[:MAX_PIVOTS]
+        for p in pivots:
+            missing = False
+            to_pivot = [m[i * n + p] for i in range(n)]
+            from_pivot = m[p * n:(p + 1) * n]
+            for i in rows:
+                a = to_pivot[i]
+                if a != a:
+                    missing = True
+                    continue
+                row = i * n
+                for j in rows:
+                    if m[row + j] != m[row + j]:
+                        b = from_pivot[j]
+                        if b == b:
+                            m[row + j] = a * b
+                        else:
+                            missing = True
+            if not missing:
+                break
+
+    def __contains__(self, code: str) -> bool:
+        """Есть ли для валюты хотя бы один курс."""
+        i = self.index.get(code)
+        return i is not None and bool(self.known[i])
+
+    def rate(self, from_code: str, to_code: str) -> float:
+        """Сколько единиц to_code стоит 1 единица from_code."""
+        i = self.index.get(from_code)
+        if i is None:
+            raise CurrencyNotFoundError(from_code)
+        j = self.index.get(to_code)
+        if j is None:
+            raise CurrencyNotFoundError(to_code)
+        value = self.matrix[i * self.size + j]
+        if value != value:
+            raise CurrencyNotFoundError(f"{from_code}→{to_code}")
+        return value
+
+    def rate_by_id(self, from_id: int, to_id: int) -> float:
+        """Курс по id валют справочника; NaN — курса нет."""
+        return self.matrix[from_id * self.size + to_id]
+
+    def rate_or_nan(self, from_code: str, to_code: str) -> float:
+        i = self.index.get(from_code)
+        j = self.index.get(to_code)
+        if i is None or j is None:
+            return NAN
+        return self.matrix[i * self.size + j]
+
+    def column(self, to_code: str) -> array:
+        """Курсы всех валют справочника к to_code в порядке id."""
+        j = self.index.get(to_code)
+        if j is None:
+            raise CurrencyNotFoundError(to_code)
+        n, m = self.size, self.matrix
+        return array('d', (m[i * n + j] for i in range(n)))
+
+
+# id(снимок) -> (снимок, граф). Снимок rates_cache неизменяем и заменяется при каждой
+# перезагрузке файла, поэтому его identity и есть ключ версии курсов. Ссылка на снимок
+# в кеше не дает переиспользовать его id.
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+MAX_CACHED_GRAPHS = 4
+
+
+def _remember(rates, graph: RateGraph) -> RateGraph:
+    with _graphs_lock:
+        _graphs[id(rates)] = (rates, graph)
+        _graphs.move_to_end(id(rates))
+        while len(_graphs) > MAX_CACHED_GRAPHS:
+            _graphs.popitem(last=False)
+    return graph
+
+
+@rates_cache.on_reload
+def _build_on_reload(snapshot):
+    # Граф строится при перезагрузке кеша курсов, а не при первом запросе курса
+    pairs = snapshot.get('pairs')
+    if pairs:
+        _remember(snapshot, RateGraph(pairs))
+
+
+def get_rate_graph(rates: dict) -> RateGraph:
+    """
+    Граф для данных rates.json. Для снимков rates_cache берется граф,
+    построенный при загрузке снимка; изменяемый dict каждый раз
+    пересчитывается, иначе правка на месте вернула бы старую матрицу.
+    """
+    with _graphs_lock:
+        entry = _graphs.get(id(rates))
+    if entry is not None and entry[0] is rates:
+        return entry[1]
+    graph = RateGraph(rates.get('pairs') or {})
+    if isinstance(rates, MappingProxyType):
+        _remember(rates, graph)
+    return graph
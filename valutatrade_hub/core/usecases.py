@@ -3,24 +3,25 @@
 from .models import User, Wallet, Rate, Portfolio
 import json
 from ..decorators import log_action
-import currencies
-from exceptions import (
+from .exceptions import (
     CurrencyNotFoundError,
     InsufficientFundsError,
-    ApiRequestError
+    ApiRequestError,
+    OrderBatchError
 )
 from valutatrade_hub.infra import settings
-from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
-from valutatrade_hub.parser_service import updater
+from valutatrade_hub.infra import database
+from valutatrade_hub.infra import rates_cache
 from valutatrade_hub.cli.interface import load_json, save_json, get_rate, get_exchange_rate_static
 from valutatrade_hub.core.currencies import CryptoCurrency,FiatCurrency,Currency
-from exceptions import RatesCacheExpiredError
+from valutatrade_hub.core.rate_graph import get_rate_graph
+from .exceptions import RatesCacheExpiredError
 import os
 from ..decorators import log_action
 import logging
+from dataclasses import dataclass
 from datetime import datetime
 
-cur = CryptoCurrency()
 config = settings.SettingsLoader()
 @log_action('LOAD_USERS')
 def load_users(file_path: str) -> dict[int, User]:
@@ -62,83 +63,61 @@ def buy(user_id: int, currency_code: str, amount: float):
     if amount <= 0:
         raise ValueError("Сумма должна быть больше нуля.")
     
-    currency_code = cur.get_currency(currency_code)
+    currency_code = currency_code.upper()
 
-    rates_data = load_json(settings.SettingsLoader().get('rates_path', 'data/rates.json'))
+    rates_data = rates_cache.get_rates(settings.SettingsLoader().get('rates_path', 'data/rates.json'))
     # Получаем курс к USD
     rate_to_usd = get_exchange_rate_static(currency_code, 'USD', rates_data)
     if rate_to_usd is None:
         raise ApiRequestError(f"Не удалось получить курс для {currency_code}")
 
-    # Обновление портфеля
-    portfolios = load_json(config.get('portfolios_path', 'data/portfolios.json'))
-    # Предполагаем, что портфель - список dict, по user_id
-    portfolio = next((p for p in portfolios if p['user_id'] == user_id), None)
-    if not portfolio:
-        # Создаем новый
-        portfolio = {'user_id': user_id, 'wallets': {}}
-        portfolios.append(portfolio)
-
-    wallets = portfolio['wallets']
-    wallet_data = wallets.get(currency_code)
-    if not wallet_data:
-        # Создаем кошелек
-        wallets[currency_code] = {'balance': 0.0}
-        wallet_data = wallets[currency_code]
-
-    # Пополнение кошелька
-    wallet_data['balance'] += amount
-
-    # Сохраняем
-    save_json(config.get('portfolios_path', 'data/portfolios.json'), portfolios)
+    # Пополнение кошелька (кошелек создается при отсутствии)
+    database.get_portfolio_repository().apply_deltas(user_id, {currency_code: amount})
 
     # Логирование
     logger.info(f"User {user_id} купил {amount} {currency_code} по курсу {rate_to_usd}")
+    return {'rate': rate_to_usd}
 
 @log_action('SELL_CURRENCY')
 def sell(user_id: int, currency_code: str, amount: float):
     if amount <= 0:
         raise ValueError("Сумма должна быть больше нуля.")
-    currency_code = cur.get_currency(currency_code)
+    currency_code = currency_code.upper()
 
-    portfolios = load_json(config.get('portfolios_path', 'data/portfolios.json'))
-    portfolio = next((p for p in portfolios if p['user_id'] == user_id), None)
-    if not portfolio:
-        raise InsufficientFundsError("Портфель пользователя не найден.")
-
-    wallets = portfolio['wallets']
-    wallet_data = wallets.get(currency_code)
-    if not wallet_data or wallet_data['balance'] < amount:
-        raise InsufficientFundsError(f"Недостаточно средств для продажи {amount} {currency_code}")
+    repository = database.get_portfolio_repository()
+    balance = repository.get_balance(user_id, currency_code)
+    if balance is None or balance < amount:
+        raise InsufficientFundsError(balance or 0.0, currency_code, amount)
 
     # Получаем курс к USD
-    rates_data = load_json(config.get('rates_path', 'data/rates.json'))
+    rates_data = rates_cache.get_rates(config.get('rates_path', 'data/rates.json'))
     rate_to_usd = get_exchange_rate_static(currency_code, 'USD', rates_data)
     if rate_to_usd is None:
         raise ApiRequestError(f"Не удалось получить курс для {currency_code}")
 
     # Списание
-    wallet_data['balance'] -= amount
-
-    save_json(config.get('portfolios_path', 'data/portfolios.json'), portfolios)
+    repository.apply_deltas(user_id, {currency_code: -amount})
 
     # Логирование
     logger.info(f"User {user_id} продал {amount} {currency_code} по курсу {rate_to_usd}")
+    return {'rate': rate_to_usd}
 
 @log_action('GET_RATE')
 def get_rate(from_code: str, to_code: str):
-    from_code = cur.get_currency(from_code)
-    to_code = cur.get_currency(to_code)
+    from_code = from_code.upper()
+    to_code = to_code.upper()
 
     # Проверка TTL и обновление кеша
     rates_path = config.get('rates_path', 'data/rates.json')
-    rates_data = load_json(rates_path)
+    rates_data = rates_cache.get_rates(rates_path)
     last_refresh_str = rates_data.get('metadata', {}).get('last_refresh')
 
     ttl_seconds = settings.SettingsLoader().get('rates_ttl_seconds', 3600)
 
-    if not last_refresh_str or cur.needs_rate_update(last_refresh_str, ttl_seconds):
-        # Попытка обновления
+    if not last_refresh_str or Currency.needs_rate_update(last_refresh_str, ttl_seconds):
+        # Попытка обновления (сервис курсов нужен только здесь, импортируем по требованию)
+        from valutatrade_hub.parser_service import updater
+        from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
         try:
             updater_instance = updater.RatesUpdater(
                 api_clients=[
@@ -148,23 +127,112 @@ def get_rate(from_code: str, to_code: str):
                 storage=None  # Замените на нужный, если есть
             )
             updater_instance.run_update()
-            rates_data = load_json(rates_path)
+            rates_data = rates_cache.get_rates(rates_path)
         except Exception as e:
             raise RatesCacheExpiredError("Требуется обновление курсов, но оно не удалось: " + str(e))
 
-    # Получение курса
-    rate_value = None
-    key = f"{from_code}_{to_code}"
-    rates_dict = rates_data.get('rates', {})
-    if key in rates_dict:
-        rate_value = rates_dict[key]
-    else:
-        # Обратный курс
-        reverse_key = f"{to_code}_{from_code}"
-        reverse_rate = rates_dict.get(reverse_key)
-        if reverse_rate:
-            rate_value = 1 / reverse_rate
-        else:
-            raise CurrencyNotFoundError(f"Курс для {from_code}→{to_code} не найден.")
-
-    return {'rate': rate_value, 'updated_at': rates_data.get('metadata', {}).get('last_refresh')}
\ No newline at end of file
+    # Получение курса (прямой, обратный или кросс-курс) из матрицы конверсии
+    rate_value = get_rate_graph(rates_data).rate(from_code, to_code)
+
+    return {'rate': rate_value, 'updated_at': rates_data.get('metadata', {}).get('last_refresh')}
+
+
+@dataclass
+class Order:
+    user_id: int
+    side: str           # 'buy' или 'sell'
+    currency_code: str
+    amount: float
+
+
+@dataclass
+class OrderResult:
+    order: Order
+    ok: bool
+    rate: float = 0.0        # курс currency_code к USD из снимка
+    usd_amount: float = 0.0  # списано (buy) или зачислено (sell) USD
+    error: str = ''
+
+
+def summarize_orders(args, kwargs, result):
+    """Поля лога для execute_orders: счетчики вместо списка ордеров и результатов."""
+    if not isinstance(result, list):
+        return {'user': 'batch', 'currency': 'N/A', 'amount': 'N/A'}
+    return {
+        'user': 'batch',
+        'currency': 'N/A',
+        'amount': len(result),
+        'result': {'orders': len(result), 'executed': sum(1 for r in result if r.ok)},
+    }
+
+
+@log_action('EXECUTE_ORDERS', summarize=summarize_orders)
+def execute_orders(orders, atomic: bool = True) -> list[OrderResult]:
+    """
+    Исполняет пакет ордеров многих пользователей.
+
+    Все ордера проверяются по одному снимку курсов и текущим балансам
+    (с учетом предыдущих ордеров пакета). Покупка списывает USD и зачисляет
+    валюту, продажа — наоборот. Изменения сохраняются одним вызовом
+    apply_deltas_batch. При atomic=True любой отклоненный ордер отменяет
+    весь пакет (OrderBatchError), иначе исполняются только прошедшие проверку.
+    """
+    orders = [order if isinstance(order, Order) else Order(**order) for order in orders]
+    graph = get_rate_graph(rates_cache.get_rates(config.get('rates_path', 'data/rates.json')))
+    catalog = graph.catalog
+    to_usd = graph.column('USD')  # курс к USD по id валюты
+    repository = database.get_portfolio_repository()
+
+    balances = {}  # user_id -> рабочая копия кошельков
+    batch = {}     # user_id -> суммарные приращения
+    results = []
+    for order in orders:
+        code = order.currency_code
+        try:
+            try:
+                user_id = int(order.user_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"Некорректный user_id {order.user_id!r}") from None
+            try:
+                amount = float(order.amount)
+            except (TypeError, ValueError):
+                raise ValueError(f"Сумма должна быть числом, получено {order.amount!r}") from None
+            if not amount > 0:  # отсекает и NaN
+                raise ValueError("Сумма должна быть больше нуля.")
+            if order.side not in ('buy', 'sell'):
+                raise ValueError(f"Неизвестный тип ордера '{order.side}'")
+            currency_id = catalog.id(code)
+            code = catalog.codes[currency_id]
+            rate = to_usd[currency_id]
+            if rate != rate:
+                raise CurrencyNotFoundError(f"{code}→USD")
+            usd_amount = amount * rate
+            if user_id not in balances:
+                balances[user_id] = repository.get_wallets(user_id)
+            wallets = balances[user_id]
+            if order.side == 'buy':
+                debit_code, debit, credit_code, credit = 'USD', usd_amount, code, amount
+            else:
+                debit_code, debit, credit_code, credit = code, amount, 'USD', usd_amount
+            available = wallets.get(debit_code, 0.0)
+            if available < debit:
+                raise InsufficientFundsError(available, debit_code, debit)
+        except (ValueError, CurrencyNotFoundError, InsufficientFundsError) as e:
+            results.append(OrderResult(order, False, error=str(e)))
+            continue
+
+        wallets[debit_code] = available - debit
+        wallets[credit_code] = wallets.get(credit_code, 0.0) + credit
+        deltas = batch.setdefault(user_id, {})
+        deltas[debit_code] = deltas.get(debit_code, 0.0) - debit
+        deltas[credit_code] = deltas.get(credit_code, 0.0) + credit
+        results.append(OrderResult(order, True, rate, usd_amount))
+
+    failed = sum(1 for result in results if not result.ok)
+    if atomic and failed:
+        logger.info(f"Пакет из {len(results)} ордеров отклонен: {failed} с ошибками")
+        raise OrderBatchError(results)
+    if batch:
+        repository.apply_deltas_batch(batch)
+    logger.info(f"Исполнено ордеров: {len(results) - failed} из {len(results)}, пользователей: {len(batch)}")
+    return results
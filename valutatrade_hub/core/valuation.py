@@ -0,0 +1,107 @@
+# vaultatrade_hub/core/valuation.py
+
+import heapq
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from .rate_graph import NAN, RateGraph
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него считаем обычными циклами
+    np = None
+
+
+@dataclass
+class WalletArrays:
+    """Все кошельки в виде параллельных массивов (user_idx, currency_idx, balance)."""
+    user_ids: List[int] = field(default_factory=list)       # user_idx -> user_id
+    currencies: List[str] = field(default_factory=list)     # currency_idx -> код
+    user_idx: array = field(default_factory=lambda: array('q'))
+    currency_idx: array = field(default_factory=lambda: array('q'))
+    balances: array = field(default_factory=lambda: array('d'))
+
+
+@dataclass
+class ValuationReport:
+    base: str
+    user_ids: List[int]
+    totals: List[float]                 # стоимость портфеля по user_idx
+    exposure: Dict[str, float]          # суммарная стоимость по валютам
+    missing_rates: List[str]            # валюты без курса (не учтены)
+
+    @property
+    def total_aum(self) -> float:
+        return sum(self.totals)
+
+    def top_users(self, n: int):
+        order = heapq.nlargest(n, range(len(self.totals)), key=self.totals.__getitem__)
+        return [(self.user_ids[i], self.totals[i]) for i in order]
+
+
+def load_wallet_arrays(wallets) -> WalletArrays:
+    """
+    Собирает массивы из итератора (user_id, currency, balance), интернируя индексы.
+    Хранилище портфелей тоже подходит: если оно держит кошельки в WalletTable
+    (есть to_wallet_arrays), массивы берутся из таблицы без перебора кортежей.
+    """
+    if hasattr(wallets, 'to_wallet_arrays'):
+        return wallets.to_wallet_arrays()
+    if hasattr(wallets, 'iter_wallets'):
+        wallets = wallets.iter_wallets()
+    data = WalletArrays()
+    user_index = {}
+    currency_index = {}
+    for user_id, code, balance in wallets:
+        u = user_index.get(user_id)
+        if u is None:
+            u = user_index[user_id] = len(data.user_ids)
+            data.user_ids.append(user_id)
+        c = currency_index.get(code)
+        if c is None:
+            c = currency_index[code] = len(data.currencies)
+            data.currencies.append(code)
+        data.user_idx.append(u)
+        data.currency_idx.append(c)
+        data.balances.append(balance)
+    return data
+
+
+def rate_vector(currencies: List[str], graph: RateGraph, base: str = 'USD') -> array:
+    """Курсы валют к base в порядке currency_idx; NaN — курса нет."""
+    if base not in graph:
+        raise ValueError(f"Курс для {base} не определен.")
+    column = graph.column(base)
+    index = graph.index
+    return array('d', (column[index[code]] if code in index else NAN for code in currencies))
+
+
+def value_all(data: WalletArrays, graph: RateGraph, base: str = 'USD') -> ValuationReport:
+    """Оценивает все портфели разом: стоимость по пользователям и по валютам."""
+    rates = rate_vector(data.currencies, graph, base)
+    missing = [code for code, rate in zip(data.currencies, rates) if rate != rate]
+    n_users, n_currencies = len(data.user_ids), len(data.currencies)
+
+    if np is not None and len(data.balances):
+        user_idx = np.frombuffer(data.user_idx, dtype=np.int64)
+        currency_idx = np.frombuffer(data.currency_idx, dtype=np.int64)
+        rate_arr = np.nan_to_num(np.frombuffer(rates, dtype=np.float64), nan=0.0)
+        values = np.frombuffer(data.balances, dtype=np.float64) * rate_arr[currency_idx]
+        totals = np.bincount(user_idx, weights=values, minlength=n_users).tolist()
+        exposure_arr = np.bincount(currency_idx, weights=values, minlength=n_currencies).tolist()
+    else:
+        totals = [0.0] * n_users
+        exposure_arr = [0.0] * n_currencies
+        for u, c, balance in zip(data.user_idx, data.currency_idx, data.balances):
+            rate = rates[c]
+            if rate != rate:
+                continue
+            value = balance * rate
+            totals[u] += value
+            exposure_arr[c] += value
+
+    missing_set = set(missing)
+    exposure = {code: exposure_arr[i] for i, code in enumerate(data.currencies)
+                if code not in missing_set}
+    return ValuationReport(base, data.user_ids, totals, exposure, missing)
@@ -0,0 +1,161 @@
+# vaultatrade_hub/core/wallet_table.py
+
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Tuple
+
+from .models import Wallet, check_deposit, check_withdraw
+from .valuation import WalletArrays
+
+CURRENCY_BITS = 16  # до 65536 валют
+
+
+class WalletTable:
+    """
+    Кошельки в виде таблицы столбцов для массовой работы в памяти.
+
+    Строка — один кошелек: user_id в array('q'), индекс валюты в array('H'),
+    баланс в array('d'). Коды валют интернируются и хранятся один раз.
+    Строки находятся бинарным поиском по отсортированному массиву ключей
+    user_id << 16 | currency_idx; только что добавленные — через небольшой
+    словарь, который периодически вливается в массив.
+    Пополнение и списание проверяются так же, как Wallet.deposit/withdraw.
+    Используется хранилищами портфелей в памяти (infra/store.py).
+    """
+
+    def __init__(self):
+        self.currencies: List[str] = []              # currency_idx -> код
+        self._currency_index: Dict[str, int] = {}    # код -> currency_idx
+        self.user_ids = array('q')
+        self.currency_idx = array('H')
+        self.balances = array('d')
+        self._keys = array('q')                      # отсортированные ключи проиндексированных строк
+        self._key_rows = array('q')                  # номер строки для self._keys[i]
+        self._tail: Dict[int, int] = {}              # ключ -> строка, добавленные после индексации
+        self._tail_users: Dict[int, List[int]] = {}  # user_id -> строки из _tail
+
+    @classmethod
+    def from_wallets(cls, wallets) -> 'WalletTable':
+        """Из итератора (user_id, currency, balance), например repository.iter_wallets()."""
+        table = cls()
+        # Загружаем без поиска дубликатов и строим индекс один раз
+        for user_id, code, balance in wallets:
+            table._append(int(user_id), table.currency_id(code), float(balance) if balance >= 0 else 0.0)
+        table._reindex()
+        return table
+
+    def __len__(self):
+        return len(self.balances)
+
+    def currency_id(self, code: str) -> int:
+        index = self._currency_index.get(code)
+        if index is None:
+            if len(self.currencies) >= 1 << CURRENCY_BITS:
+                raise ValueError("Слишком много валют для WalletTable.")
+            code = sys.intern(code)
+            index = self._currency_index[code] = len(self.currencies)
+            self.currencies.append(code)
+        return index
+
+    def _append(self, user_id: int, index: int, balance: float) -> int:
+        self.user_ids.append(user_id)
+        self.currency_idx.append(index)
+        self.balances.append(balance)
+        return len(self.balances) - 1
+
+    def _reindex(self):
+        user_ids, currency_idx = self.user_ids, self.currency_idx
+        order = sorted(range(len(self.balances)),
+                       key=lambda row: (user_ids[row] << CURRENCY_BITS) | currency_idx[row])
+        keys = array('q', ((user_ids[row] << CURRENCY_BITS) | currency_idx[row] for row in order))
+        for i in range(1, len(keys)):
+            if keys[i] == keys[i - 1]:
+                raise ValueError(f"Повторяющийся кошелек: user_id={keys[i] >> CURRENCY_BITS}, "
+                                 f"валюта {self.currencies[keys[i] & ((1 << CURRENCY_BITS) - 1)]}")
+        self._keys = keys
+        self._key_rows = array('q', order)
+        self._tail.clear()
+        self._tail_users.clear()
+
+    def _find(self, key: int):
+        row = self._tail.get(key)
+        if row is not None:
+            return row
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._key_rows[i]
+        return None
+
+    def add(self, user_id: int, code: str, balance: float = 0.0) -> int:
+        """Добавляет кошелек (или задает баланс существующему). Возвращает номер строки."""
+        index = self.currency_id(code)
+        key = (int(user_id) << CURRENCY_BITS) | index
+        balance = float(balance) if balance >= 0 else 0.0
+        row = self._find(key)
+        if row is not None:
+            self.balances[row] = balance
+            return row
+        row = self._tail[key] = self._append(int(user_id), index, balance)
+        self._tail_users.setdefault(int(user_id), []).append(row)
+        if len(self._tail) > max(1024, len(self._keys) // 8):
+            self._reindex()
+        return row
+
+    def row(self, user_id: int, code: str):
+        """Номер строки кошелька или None."""
+        index = self._currency_index.get(code)
+        if index is None:
+            return None
+        return self._find((int(user_id) << CURRENCY_BITS) | index)
+
+    def user_wallets(self, user_id: int) -> Dict[str, float]:
+        """Все кошельки пользователя {код: баланс}: срез отсортированных ключей и его строки из _tail."""
+        user_id = int(user_id)
+        lo = bisect_left(self._keys, user_id << CURRENCY_BITS)
+        hi = bisect_left(self._keys, (user_id + 1) << CURRENCY_BITS)
+        rows = list(self._key_rows[lo:hi]) + self._tail_users.get(user_id, [])
+        currencies, currency_idx, balances = self.currencies, self.currency_idx, self.balances
+        return {currencies[currency_idx[row]]: balances[row] for row in rows}
+
+    def get_balance(self, user_id: int, code: str):
+        row = self.row(user_id, code)
+        return self.balances[row] if row is not None else None
+
+    def deposit(self, user_id: int, code: str, amount: float):
+        check_deposit(amount)
+        row = self.row(user_id, code)
+        if row is None:
+            row = self.add(user_id, code)
+        self.balances[row] += amount
+
+    def withdraw(self, user_id: int, code: str, amount: float):
+        row = self.row(user_id, code)
+        check_withdraw(amount, self.balances[row] if row is not None else 0.0)
+        self.balances[row] -= amount
+
+    def wallet(self, user_id: int, code: str) -> Wallet:
+        """Копия кошелька в виде объекта (изменения в таблицу не попадают)."""
+        balance = self.get_balance(user_id, code)
+        if balance is None:
+            raise KeyError(f"{user_id}:{code}")
+        return Wallet(code, balance)
+
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        currencies = self.currencies
+        for user_id, index, balance in zip(self.user_ids, self.currency_idx, self.balances):
+            yield user_id, currencies[index], balance
+
+    def to_wallet_arrays(self) -> WalletArrays:
+        """Представление для core/valuation.value_all без повторного интернирования валют."""
+        data = WalletArrays(currencies=list(self.currencies))
+        user_index = {}
+        for user_id in self.user_ids:
+            u = user_index.get(user_id)
+            if u is None:
+                u = user_index[user_id] = len(data.user_ids)
+                data.user_ids.append(user_id)
+            data.user_idx.append(u)
+        data.currency_idx = array('q', self.currency_idx)
+        data.balances = array('d', self.balances)
+        return data
@@ -1,63 +1,96 @@
 import functools
 import logging
+import time
 from datetime import datetime
 
+from valutatrade_hub.infra.metrics import registry
+
 logger = logging.getLogger('actions')
 
-def log_action(action_type, verbose=False):
+ACTION_SECONDS = registry.histogram(
+    'valutatrade_action_duration_seconds', 'Длительность действий @log_action', ('action',))
+ACTIONS = registry.counter('valutatrade_actions_total', 'Выполненные действия @log_action', ('action', 'status'))
+
+def log_action(action_type, verbose=False, summarize=None):
     """
     Декоратор для логирования действия.
     :param action_type: 'BUY', 'SELL', 'REGISTER', 'LOGIN'
     :param verbose: bool, добавлять дополнительный контекст
+    :param summarize: summarize(args, kwargs, result) -> dict полей, заменяющих
+        извлеченные по умолчанию (для действий над пакетами вместо всего списка)
+
+    Запись уходит в логгер 'actions' структурой (extra={'fields': {...}});
+    запись в файл выполняется в фоне (см. logging_config.setup_logging).
     """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             start_time = datetime.utcnow()
+            started = time.perf_counter()
             try:
                 result = func(*args, **kwargs)
-                status = 'OK'
-                error_message = ''
             except Exception as e:
-                result = 'ERROR'
-                status = 'ERROR'
-                error_message = str(e)
+                duration = time.perf_counter() - started
+                ACTION_SECONDS.observe(duration, action=action_type)
+                ACTIONS.inc(action=action_type, status='ERROR')
                 # Логировать ошибку и пробросить дальше
-                log_message = build_log_message(
-                    start_time, action_type, args, kwargs, result, error_message, verbose
-                )
-                logger.info(log_message)
+                if logger.isEnabledFor(logging.INFO):
+                    fields = build_log_fields(
+                        start_time, action_type, args, kwargs, 'ERROR', str(e), verbose, duration * 1000
+                    )
+                    if summarize is not None:
+                        fields.update(summarize(args, kwargs, 'ERROR'))
+                    logger.info(action_type, extra={'fields': fields})
                 raise
+            duration = time.perf_counter() - started
+            ACTION_SECONDS.observe(duration, action=action_type)
+            ACTIONS.inc(action=action_type, status='OK')
             # Лог успешного выполнения
-            log_message = build_log_message(
-                start_time, action_type, args, kwargs, result, '', verbose
-            )
-            logger.info(log_message)
+            if logger.isEnabledFor(logging.INFO):
+                fields = build_log_fields(
+                    start_time, action_type, args, kwargs, result, '', verbose, duration * 1000
+                )
+                if summarize is not None:
+                    fields.update(summarize(args, kwargs, result))
+                logger.info(action_type, extra={'fields': fields})
             return result
         return wrapper
     return decorator
 
-def build_log_message(start_time, action, args, kwargs, result, error_message, verbose):
-    timestamp = start_time.isoformat()
-    username = extract_username(args, kwargs)
-    currency_code = extract_currency_code(args, kwargs)
-    amount = extract_amount(args, kwargs)
-    rate = extract_rate(args, kwargs)
-    base = extract_base(args, kwargs)
-    
-    msg = f"{timestamp} {action} user='{username}' currency='{currency_code}' amount={amount} rate={rate} base='{base}' result={result}"
+def build_log_fields(start_time, action, args, kwargs, result, error_message, verbose, duration_ms):
+    fields = {
+        'started_at': start_time.isoformat(),
+        'action': action,
+        'user': extract_username(args, kwargs),
+        'currency': extract_currency_code(args, kwargs),
+        'amount': extract_amount(args, kwargs),
+        'rate': extract_rate(args, kwargs, result),
+        'base': extract_base(args, kwargs),
+        'status': 'ERROR' if error_message else 'OK',
+        'result': result,
+        'duration_ms': round(duration_ms, 3),
+    }
     if error_message:
-        msg += f" error_message='{error_message}'"
+        fields['error_message'] = error_message
     if verbose:
         # Добавить дополнительный контекст, например, состояние кошелька
-        wallet_state = get_wallet_state(args, kwargs)
-        msg += f" wallet_state={wallet_state}"
-    return msg
+        fields['wallet_state'] = get_wallet_state(args, kwargs)
+    return fields
 
 # Вспомогательные функции для извлечения данных
 def extract_username(args, kwargs):
     # Предполагается, что username передается как именованный аргумент или в args
-    return kwargs.get('username') or (args[0] if args else 'unknown')
+    if kwargs.get('username'):
+        return kwargs['username']
+    if not args:
+        return 'unknown'
+    # Метод Portfolio: пользователь берется из self.user (dict из CLI или объект User)
+    user = getattr(args[0], 'user', None)
+    if isinstance(user, dict):
+        return user.get('username', 'unknown')
+    if user is not None:
+        return getattr(user, 'username', 'unknown')
+    return args[0]
 
 def extract_currency_code(args, kwargs):
     return kwargs.get('currency_code') or (args[1] if len(args) > 1 else 'UNKNOWN')
@@ -65,8 +98,14 @@ def extract_currency_code(args, kwargs):
 def extract_amount(args, kwargs):
     return kwargs.get('amount') or (args[2] if len(args) > 2 else '0')
 
-def extract_rate(args, kwargs):
-    return kwargs.get('rate') or 'N/A'
+def extract_rate(args, kwargs, result=None):
+    # Курс передан явно, возвращен действием ({'rate': ...}) или пришел объектом Rate
+    rate = kwargs.get('rate')
+    if rate is None and isinstance(result, dict):
+        rate = result.get('rate')
+    if rate is None:
+        rate = next((arg.rate for arg in args if hasattr(arg, 'rate')), None)
+    return rate if rate is not None else 'N/A'
 
 def extract_base(args, kwargs):
     return kwargs.get('base') or 'N/A'
@@ -0,0 +1,485 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, Optional, Tuple
+
+from valutatrade_hub.infra import settings
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+STORAGE_BACKEND = config.get('storage_backend', 'sqlite')
+DATABASE_PATH = config.get('database_path', 'data/valutatrade.db')
+USERS_FILE = config.get('users_path', 'data/users.json')
+PORTFOLIOS_FILE = config.get('portfolios_path', 'data/portfolios.json')
+
+
+def load_json(file_path):
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    return []
+
+
+def save_json(file_path, data):
+    with open(file_path, 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+# Интерфейсы репозиториев
+
+class UserRepository(ABC):
+    """Хранилище пользователей. Пользователь — словарь с полями users.json."""
+
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def add_user(self, username: str, hashed_password: str, registration_date: str) -> int:
+        """Добавляет пользователя и возвращает присвоенный user_id."""
+        pass
+
+    def close(self):
+        """Освобождает ресурсы хранилища (если они есть)."""
+        pass
+
+
+class PortfolioRepository(ABC):
+    """Хранилище кошельков: (user_id, currency) -> balance."""
+
+    @abstractmethod
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        """Возвращает {код валюты: баланс}. Пустой словарь — портфеля нет."""
+        pass
+
+    @abstractmethod
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        pass
+
+    def create_portfolios_batch(self, portfolios: Dict[int, Dict[str, float]]):
+        """
+        Создает портфели сразу многим пользователям: {user_id: {код: баланс}}.
+        Хранилища переопределяют метод, чтобы записать всё одной транзакцией.
+        """
+        for user_id, wallets in portfolios.items():
+            self.create_portfolio(user_id, wallets)
+
+    @abstractmethod
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        """
+        Атомарно изменяет балансы пользователя на заданные приращения.
+        Несуществующие кошельки создаются с нулевым балансом.
+        """
+        pass
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        """
+        Применяет приращения сразу многим пользователям: {user_id: {код: приращение}}.
+        Хранилища переопределяют метод, чтобы записать всё одной транзакцией.
+        """
+        for user_id, deltas in batch.items():
+            self.apply_deltas(user_id, deltas)
+
+    @abstractmethod
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        """Перебирает все кошельки в виде (user_id, currency, balance)."""
+        pass
+
+    def get_balance(self, user_id: int, currency_code: str) -> Optional[float]:
+        return self.get_wallets(user_id).get(currency_code)
+
+    def flush(self):
+        """Сбрасывает отложенные изменения на диск (если они есть)."""
+        pass
+
+    def close(self):
+        self.flush()
+
+
+# SQLite
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    registration_date TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+
+-- Первичный ключ (user_id, currency) служит и индексом по user_id
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    balance REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, currency)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteRepository(UserRepository, PortfolioRepository):
+    """Встроенная база SQLite (WAL) для пользователей и портфелей."""
+
+    def __init__(self, db_path: str = DATABASE_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    # Пользователи
+
+    def _fetchone(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        row = self._fetchone("SELECT * FROM users WHERE username = ?", (username,))
+        return dict(row) if row else None
+
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        row = self._fetchone("SELECT * FROM users WHERE user_id = ?", (int(user_id),))
+        return dict(row) if row else None
+
+    def add_user(self, username: str, hashed_password: str, registration_date: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO users (username, hashed_password, registration_date) VALUES (?, ?, ?)",
+                (username, hashed_password, registration_date),
+            )
+            return cursor.lastrowid
+
+    def register_user(self, username: str, hashed_password: str, registration_date: str,
+                      wallets: Dict[str, float]) -> int:
+        """Добавляет пользователя вместе с портфелем одной транзакцией."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                user_id = self._conn.execute(
+                    "INSERT INTO users (username, hashed_password, registration_date) VALUES (?, ?, ?)",
+                    (username, hashed_password, registration_date),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO wallets (user_id, currency, balance) VALUES (?, ?, ?)",
+                    [(user_id, code, float(balance)) for code, balance in wallets.items()],
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return user_id
+
+    # Портфели
+
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        rows = self._fetchall(
+            "SELECT currency, balance FROM wallets WHERE user_id = ?", (int(user_id),)
+        )
+        return {row['currency']: row['balance'] for row in rows}
+
+    def get_balance(self, user_id: int, currency_code: str) -> Optional[float]:
+        row = self._fetchone(
+            "SELECT balance FROM wallets WHERE user_id = ? AND currency = ?",
+            (int(user_id), currency_code),
+        )
+        return row['balance'] if row else None
+
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        self.create_portfolios_batch({user_id: wallets})
+
+    def create_portfolios_batch(self, portfolios: Dict[int, Dict[str, float]]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO wallets (user_id, currency, balance) VALUES (?, ?, ?)",
+                    [(int(user_id), code, float(balance))
+                     for user_id, wallets in portfolios.items() for code, balance in wallets.items()],
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        self.apply_deltas_batch({user_id: deltas})
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        # Все пользователи — в одной транзакции. Списания проверяются внутри нее
+        # условным UPDATE, чтобы параллельные продажи не увели баланс в минус.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user_id, deltas in batch.items():
+                    for code, delta in deltas.items():
+                        self._apply_delta(int(user_id), code, float(delta))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _apply_delta(self, user_id: int, code: str, delta: float):
+        if delta >= 0:
+            self._conn.execute(
+                "INSERT INTO wallets (user_id, currency, balance) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, currency) DO UPDATE SET balance = balance + excluded.balance",
+                (user_id, code, delta),
+            )
+            return
+        cursor = self._conn.execute(
+            "UPDATE wallets SET balance = balance + ? "
+            "WHERE user_id = ? AND currency = ? AND balance >= ?",
+            (delta, user_id, code, -delta),
+        )
+        if cursor.rowcount == 0:
+            raise ValueError("Недостаточно средств на балансе.")
+
+    def iter_wallets(self, chunk_size: int = 10000) -> Iterator[Tuple[int, str, float]]:
+        # Читаем порциями по ключу, чтобы не держать блокировку на всё время обхода
+        last_key = (-1, '')
+        while True:
+            rows = self._fetchall(
+                "SELECT user_id, currency, balance FROM wallets "
+                "WHERE (user_id, currency) > (?, ?) ORDER BY user_id, currency LIMIT ?",
+                (*last_key, chunk_size),
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield row['user_id'], row['currency'], row['balance']
+            last_key = (rows[-1]['user_id'], rows[-1]['currency'])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# JSON (прежний формат data/users.json и data/portfolios.json)
+
+class JsonUserRepository(UserRepository):
+    def __init__(self, users_path: str = USERS_FILE):
+        self.users_path = users_path
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        return next((u for u in load_json(self.users_path) if u['username'] == username), None)
+
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        return next((u for u in load_json(self.users_path) if u['user_id'] == int(user_id)), None)
+
+    def add_user(self, username: str, hashed_password: str, registration_date: str) -> int:
+        users = load_json(self.users_path)
+        user_id = max((u['user_id'] for u in users), default=0) + 1
+        users.append({
+            'user_id': user_id,
+            'username': username,
+            'hashed_password': hashed_password,
+            'registration_date': registration_date,
+        })
+        save_json(self.users_path, users)
+        return user_id
+
+
+class JsonPortfolioRepository(PortfolioRepository):
+    def __init__(self, portfolios_path: str = PORTFOLIOS_FILE):
+        self.portfolios_path = portfolios_path
+
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        portfolios = load_json(self.portfolios_path)
+        entry = next((p for p in portfolios if p['user_id'] == int(user_id)), None)
+        if entry is None:
+            return {}
+        return {code: data['balance'] for code, data in entry['wallets'].items()}
+
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        self.create_portfolios_batch({user_id: wallets})
+
+    def create_portfolios_batch(self, batch: Dict[int, Dict[str, float]]):
+        portfolios = load_json(self.portfolios_path)
+        entries = {p['user_id']: p for p in portfolios}
+        for user_id, wallets in batch.items():
+            entry = entries.get(int(user_id))
+            if entry is None:
+                entry = {'user_id': int(user_id), 'wallets': {}}
+                portfolios.append(entry)
+                entries[entry['user_id']] = entry
+            entry['wallets'].update({code: {'balance': float(balance)} for code, balance in wallets.items()})
+        # Одна запись файла на всех пользователей
+        save_json(self.portfolios_path, portfolios)
+
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        self.apply_deltas_batch({user_id: deltas})
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        portfolios = load_json(self.portfolios_path)
+        entries = {p['user_id']: p for p in portfolios}
+        for user_id, deltas in batch.items():
+            entry = entries.get(int(user_id))
+            if entry is None:
+                entry = {'user_id': int(user_id), 'wallets': {}}
+                portfolios.append(entry)
+                entries[entry['user_id']] = entry
+            for code, delta in deltas.items():
+                wallet = entry['wallets'].setdefault(code, {'balance': 0.0})
+                wallet['balance'] += delta
+        # Одна запись файла на все изменения
+        save_json(self.portfolios_path, portfolios)
+
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        for entry in load_json(self.portfolios_path):
+            for code, data in entry['wallets'].items():
+                yield entry['user_id'], code, data['balance']
+
+
+# Миграция
+
+def migrate_json_to_sqlite(users_path: str = USERS_FILE,
+                           portfolios_path: str = PORTFOLIOS_FILE,
+                           repository: Optional[SQLiteRepository] = None) -> SQLiteRepository:
+    """Однократно переносит users.json и portfolios.json в SQLite."""
+    repository = repository or SQLiteRepository()
+    conn = repository._conn
+    with repository._lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, username, hashed_password, registration_date) "
+                "VALUES (?, ?, ?, ?)",
+                [(u['user_id'], u['username'], u['hashed_password'], u['registration_date'])
+                 for u in load_json(users_path)],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO wallets (user_id, currency, balance) VALUES (?, ?, ?)",
+                [(p['user_id'], code, data['balance'])
+                 for p in load_json(portfolios_path)
+                 for code, data in p['wallets'].items()],
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    return repository
+
+
+# Фабрика
+
+_repositories = {}
+_batch = {}  # обертки пакетного режима поверх _repositories
+_factory_lock = threading.Lock()
+
+
+def _get_sqlite_repository() -> SQLiteRepository:
+    if 'sqlite' not in _repositories:
+        is_new = not os.path.exists(DATABASE_PATH)
+        repository = SQLiteRepository(DATABASE_PATH)
+        if is_new:
+            migrate_json_to_sqlite(USERS_FILE, PORTFOLIOS_FILE, repository)
+        _repositories['sqlite'] = repository
+    return _repositories['sqlite']
+
+
+def get_user_repository() -> UserRepository:
+    """Возвращает репозиторий пользователей согласно настройке storage_backend."""
+    with _factory_lock:
+        if 'users' in _batch:
+            return _batch['users']
+        if STORAGE_BACKEND == 'sqlite':
+            return _get_sqlite_repository()
+        if 'users' not in _repositories:
+            _repositories['users'] = JsonUserRepository(USERS_FILE)
+        return _repositories['users']
+
+
+def get_portfolio_repository() -> PortfolioRepository:
+    """Возвращает репозиторий портфелей согласно настройке storage_backend."""
+    with _factory_lock:
+        if 'portfolios' in _batch:
+            return _batch['portfolios']
+        if STORAGE_BACKEND == 'sqlite':
+            return _get_sqlite_repository()
+        if 'portfolios' not in _repositories:
+            if STORAGE_BACKEND == 'json':
+                _repositories['portfolios'] = JsonPortfolioRepository(PORTFOLIOS_FILE)
+            elif STORAGE_BACKEND == 'journal':
+                from valutatrade_hub.infra.journal import JournalPortfolioRepository
+                _repositories['portfolios'] = JournalPortfolioRepository()
+            elif STORAGE_BACKEND == 'memory':
+                from valutatrade_hub.infra.store import PortfolioStore
+                _repositories['portfolios'] = PortfolioStore()
+            elif STORAGE_BACKEND == 'sharded':
+                from valutatrade_hub.infra.sharding import ShardedPortfolioRepository
+                _repositories['portfolios'] = ShardedPortfolioRepository()
+            else:
+                raise ValueError(f"Неизвестный storage_backend: {STORAGE_BACKEND}")
+        return _repositories['portfolios']
+
+
+def register_user(username: str, hashed_password: str, registration_date: str,
+                  wallets: Dict[str, float]) -> int:
+    """
+    Регистрирует пользователя с начальным портфелем. Если пользователи и портфели
+    лежат в одной базе SQLite, запись идет одной транзакцией; иначе — двумя шагами.
+    """
+    users = get_user_repository()
+    portfolios = get_portfolio_repository()
+    if users is portfolios and isinstance(users, SQLiteRepository):
+        return users.register_user(username, hashed_password, registration_date, wallets)
+    user_id = users.add_user(username, hashed_password, registration_date)
+    portfolios.create_portfolio(user_id, wallets)
+    return user_id
+
+
+def begin_batch(commit_every: int = 0):
+    """
+    Включает пакетный режим: портфели загружаются в память один раз,
+    а изменения сохраняются каждые commit_every операций и в end_batch().
+    Возвращает буферизованный репозиторий портфелей.
+    """
+    from valutatrade_hub.infra.store import BufferedPortfolioRepository, CachedUserRepository
+    users = get_user_repository()
+    portfolios = get_portfolio_repository()
+    with _factory_lock:
+        if 'portfolios' not in _batch:
+            _batch['users'] = CachedUserRepository(users)
+            _batch['portfolios'] = BufferedPortfolioRepository(portfolios, commit_every)
+        return _batch['portfolios']
+
+
+def end_batch():
+    """Сохраняет накопленные изменения и выключает пакетный режим."""
+    with _factory_lock:
+        batch = _batch.pop('portfolios', None)
+        _batch.pop('users', None)
+    if batch is not None:
+        batch.close()
+
+
+def close_repositories():
+    """Сбрасывает и закрывает все открытые репозитории."""
+    end_batch()
+    with _factory_lock:
+        closed = set()
+        for repository in _repositories.values():
+            if id(repository) not in closed:
+                repository.close()
+                closed.add(id(repository))
+        _repositories.clear()
+
+
+if __name__ == '__main__':
+    migrate_json_to_sqlite()
+    print(f"Миграция завершена: {DATABASE_PATH}")
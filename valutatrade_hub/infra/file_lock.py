@@ -0,0 +1,28 @@
+import os
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(lock_path: str, stale_after: float = 10.0):
+    """
+    Межпроцессная блокировка на lock-файле (создание с O_EXCL работает на любой ОС).
+    Файл старше stale_after секунд считается брошенным упавшим процессом.
+    """
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.005)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+from typing import Dict, Iterator, Tuple
+
+from valutatrade_hub.infra import settings
+from valutatrade_hub.infra.database import PortfolioRepository, load_json
+from valutatrade_hub.infra.file_lock import file_lock
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+PORTFOLIOS_FILE = config.get('portfolios_path', 'data/portfolios.json')
+SNAPSHOT_FILE = config.get('portfolios_snapshot_path', 'data/portfolios.snapshot.json')
+JOURNAL_FILE = config.get('portfolios_journal_path', 'data/portfolios.journal.jsonl')
+COMPACT_EVERY = config.get('journal_compact_every', 1000)
+FSYNC = config.get('journal_fsync', True)
+
+
+def write_atomic(file_path, data):
+    """Записывает JSON во временный файл и атомарно подменяет им file_path."""
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class JournalPortfolioRepository(PortfolioRepository):
+    """
+    Портфели в памяти + журнал изменений балансов (JSONL, только дозапись).
+
+    Каждая сделка — одна строка журнала с приращениями по всем валютам,
+    поэтому сделка либо записана целиком, либо не записана вовсе.
+    При старте состояние = последний снимок + записи журнала после него.
+    Каждые compact_every записей снимок перезаписывается, а журнал обрезается.
+
+    Журнал могут одновременно вести несколько процессов: запись, сжатие и
+    перечитывание выполняются под межпроцессной блокировкой (<журнал>.lock),
+    и перед записью процесс дочитывает чужие записи из хвоста журнала.
+    """
+
+    def __init__(self, snapshot_path: str = SNAPSHOT_FILE, journal_path: str = JOURNAL_FILE,
+                 seed_path: str = PORTFOLIOS_FILE, compact_every: int = COMPACT_EVERY,
+                 fsync: bool = FSYNC):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.lock_path = f"{journal_path}.lock"
+        self.seed_path = seed_path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._portfolios: Dict[int, Dict[str, float]] = {}
+        self._seq = 0
+        self._since_snapshot = 0
+        self._offset = 0              # байт журнала, уже примененных к памяти
+        self._snapshot_stat = None    # (inode, mtime) прочитанного снимка
+        os.makedirs(os.path.dirname(journal_path) or '.', exist_ok=True)
+        with self._lock, file_lock(self.lock_path):
+            self._reload()
+        self._journal = open(journal_path, 'a')
+
+    # Восстановление
+
+    def _stat_snapshot(self):
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _reload(self):
+        """Состояние заново из снимка и всего журнала. Вызывается под блокировками."""
+        self._portfolios = {}
+        self._seq = 0
+        self._since_snapshot = 0
+        self._offset = 0
+        self._snapshot_stat = self._stat_snapshot()
+        if self._snapshot_stat is not None:
+            snapshot = load_json(self.snapshot_path)
+            self._seq = snapshot['seq']
+            entries = snapshot['portfolios']
+        else:
+            # Первый запуск: исходное состояние берем из portfolios.json
+            entries = load_json(self.seed_path)
+        for entry in entries:
+            self._portfolios[int(entry['user_id'])] = {
+                code: data['balance'] for code, data in entry['wallets'].items()
+            }
+        self._replay()
+
+    def _replay(self):
+        """Применяет записи журнала начиная с self._offset. Вызывается под блокировками."""
+        if not os.path.exists(self.journal_path):
+            return
+        valid_size = self._offset
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Недописанная строка после сбоя — отбрасываем хвост
+                    break
+                valid_size += len(line)
+                if record['seq'] <= self._seq:
+                    continue  # уже учтено в снимке
+                self._apply(record)
+                self._seq = record['seq']
+                self._since_snapshot += 1
+        if valid_size != os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_size)
+        self._offset = valid_size
+
+    def _sync(self):
+        """Догоняет изменения других процессов. Вызывается под блокировками."""
+        if (self._stat_snapshot() != self._snapshot_stat
+                or os.path.getsize(self.journal_path) < self._offset):
+            # Другой процесс сжал журнал — перечитываем снимок целиком
+            self._reload()
+        else:
+            self._replay()
+
+    def _refresh(self):
+        """Для чтения: перечитывает журнал, только если он изменился с прошлого раза."""
+        try:
+            changed = (os.path.getsize(self.journal_path) != self._offset
+                       or self._stat_snapshot() != self._snapshot_stat)
+        except FileNotFoundError:
+            changed = True
+        if changed:
+            with file_lock(self.lock_path):
+                self._sync()
+
+    def _apply(self, record):
+        if 'batch' in record:
+            # Пакет сделок многих пользователей — одна строка журнала
+            for user_id, deltas in record['batch'].items():
+                self._apply({'user_id': user_id, 'deltas': deltas})
+            return
+        if 'create_batch' in record:
+            for user_id, wallets in record['create_batch'].items():
+                self._apply({'user_id': user_id, 'set': wallets})
+            return
+        wallets = self._portfolios.setdefault(int(record['user_id']), {})
+        if 'set' in record:
+            wallets.update(record['set'])
+        for code, delta in record.get('deltas', {}).items():
+            wallets[code] = wallets.get(code, 0.0) + delta
+
+    # Запись
+
+    def _append(self, record):
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+            self._seq += 1
+            record['seq'] = self._seq
+            self._journal.write(json.dumps(record) + '\n')
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._offset = os.path.getsize(self.journal_path)
+            self._apply(record)
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        """Сохраняет снимок и обрезает журнал. Вызывается под блокировками после _sync()."""
+        write_atomic(self.snapshot_path, {
+            'seq': self._seq,
+            'portfolios': [
+                {'user_id': user_id,
+                 'wallets': {code: {'balance': balance} for code, balance in wallets.items()}}
+                for user_id, wallets in self._portfolios.items()
+            ],
+        })
+        self._snapshot_stat = self._stat_snapshot()
+        # Если сбой случится до обрезки, записи с seq <= снимка будут пропущены
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        self._offset = 0
+        self._since_snapshot = 0
+
+    def compact(self):
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+            self._compact()
+
+    # PortfolioRepository
+
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        with self._lock:
+            self._refresh()
+            return dict(self._portfolios.get(int(user_id), {}))
+
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        self._append({'user_id': int(user_id),
+                      'set': {code: float(balance) for code, balance in wallets.items()}})
+
+    def create_portfolios_batch(self, portfolios: Dict[int, Dict[str, float]]):
+        self._append({'create_batch': {
+            str(user_id): {code: float(balance) for code, balance in wallets.items()}
+            for user_id, wallets in portfolios.items()
+        }})
+
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        self._append({'user_id': int(user_id),
+                      'deltas': {code: float(delta) for code, delta in deltas.items()}})
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        self._append({'batch': {
+            str(user_id): {code: float(delta) for code, delta in deltas.items()}
+            for user_id, deltas in batch.items()
+        }})
+
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        with self._lock:
+            self._refresh()
+            items = [(user_id, dict(wallets)) for user_id, wallets in self._portfolios.items()]
+        for user_id, wallets in items:
+            for code, balance in wallets.items():
+                yield user_id, code, balance
+
+    def flush(self):
+        with self._lock:
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+    def close(self):
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+            if self._since_snapshot:
+                self._compact()
+            self._journal.close()
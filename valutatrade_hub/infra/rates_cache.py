@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+from types import MappingProxyType
+
+from valutatrade_hub.infra import settings
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+RATES_FILE = config.get('rates_path', 'data/rates.json')
+
+EMPTY = MappingProxyType({})
+
+
+def freeze(value):
+    """Рекурсивно превращает dict в MappingProxyType, list в tuple."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class RatesCache:
+    """
+    Кеш содержимого rates.json в памяти процесса.
+
+    Файл перечитывается, только если изменились его mtime или размер,
+    либо после invalidate() (его вызывает запись курсов в storage).
+    Снимок неизменяемый, поэтому его можно безопасно раздавать.
+    Обработчики on_reload получают каждый новый снимок до того, как он
+    станет виден читателям, — так производные структуры (граф курсов)
+    строятся один раз на обновление файла.
+    """
+
+    def __init__(self, path: str = RATES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._snapshot = EMPTY
+        self.reloads = 0
+
+    def get(self):
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        with self._lock:
+            if stamp != self._stamp:
+                snapshot = self._load() if stamp is not None else EMPTY
+                for listener in list(_listeners):
+                    listener(snapshot)
+                self._snapshot = snapshot
+                self._stamp = stamp
+            return self._snapshot
+
+    def _load(self):
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        self.reloads += 1
+        return freeze(data)
+
+    def invalidate(self):
+        with self._lock:
+            self._stamp = None
+            self._snapshot = EMPTY
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+_listeners = []
+
+
+def on_reload(listener):
+    """Регистрирует listener(snapshot), вызываемый при каждой перезагрузке файла курсов."""
+    _listeners.append(listener)
+    return listener
+
+
+def get_cache(path: str = RATES_FILE) -> RatesCache:
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = RatesCache(path)
+        return _caches[path]
+
+
+def get_rates(path: str = RATES_FILE):
+    """Неизменяемый снимок rates.json (пустой, если файла нет)."""
+    return get_cache(path).get()
+
+
+def invalidate(path: str = None):
+    """Сбрасывает кеш: для указанного файла или для всех."""
+    with _caches_lock:
+        caches = list(_caches.values()) if path is None else [_caches[path]] if path in _caches else []
+    for cache in caches:
+        cache.invalidate()
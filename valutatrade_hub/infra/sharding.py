@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, Tuple
+
+from valutatrade_hub.infra import settings
+from valutatrade_hub.infra.database import PortfolioRepository, load_json
+from valutatrade_hub.infra.file_lock import file_lock
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+PORTFOLIOS_FILE = config.get('portfolios_path', 'data/portfolios.json')
+SHARDS_DIR = config.get('portfolios_shards_dir', 'data/portfolios')
+SHARD_BUCKETS = config.get('portfolios_shard_buckets', 256)
+
+MANIFEST_NAME = 'manifest.json'
+LAYOUT_VERSION = 1
+
+
+class ShardedPortfolioRepository(PortfolioRepository):
+    """
+    Портфели в отдельных файлах: data/portfolios/<bucket>/<user_id>.json.
+
+    Номер каталога (bucket) — crc32(user_id) по модулю числа каталогов,
+    параметры раскладки хранятся в manifest.json. Сделка читает и
+    перезаписывает только файл своего пользователя, а блокировки взяты
+    по каталогам, поэтому разные пользователи торгуют параллельно.
+    Блокировка каталога — межпотоковая и межпроцессная (lock-файл
+    <bucket>.lock), так что CLI и --script не теряют изменения друг друга.
+    """
+
+    def __init__(self, shards_dir: str = SHARDS_DIR, buckets: int = SHARD_BUCKETS,
+                 seed_path: str = PORTFOLIOS_FILE):
+        self.shards_dir = shards_dir
+        manifest_path = os.path.join(shards_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            manifest = load_json(manifest_path)
+            if manifest.get('version') != LAYOUT_VERSION:
+                raise ValueError(f"Неподдерживаемая версия раскладки портфелей: {manifest.get('version')}")
+            self.buckets = manifest['buckets']
+        else:
+            self.buckets = buckets
+        self._locks = [threading.Lock() for _ in range(self.buckets)]
+        if not os.path.exists(manifest_path):
+            self._init_layout(manifest_path, seed_path)
+
+    def _init_layout(self, manifest_path, seed_path):
+        """Раскладывает существующий portfolios.json по файлам и пишет манифест."""
+        os.makedirs(self.shards_dir, exist_ok=True)
+        for entry in load_json(seed_path):
+            wallets = {code: data['balance'] for code, data in entry['wallets'].items()}
+            self._write_shard(int(entry['user_id']), wallets)
+        # Манифест пишется последним: его наличие означает, что раскладка готова
+        self._write_file(manifest_path, {
+            'version': LAYOUT_VERSION,
+            'buckets': self.buckets,
+            'hash': 'crc32',
+            'source': seed_path,
+        })
+
+    def _bucket(self, user_id: int) -> int:
+        return zlib.crc32(str(user_id).encode()) % self.buckets
+
+    @contextmanager
+    def _bucket_lock(self, bucket: int):
+        with self._locks[bucket], file_lock(os.path.join(self.shards_dir, f"{bucket:03x}.lock")):
+            yield
+
+    def _shard_path(self, user_id: int) -> str:
+        return os.path.join(self.shards_dir, f"{self._bucket(user_id):03x}", f"{user_id}.json")
+
+    @staticmethod
+    def _write_file(file_path, data):
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, file_path)
+
+    def _read_shard(self, user_id: int) -> Dict[str, float]:
+        path = self._shard_path(user_id)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)['wallets']
+
+    def _write_shard(self, user_id: int, wallets: Dict[str, float]):
+        path = self._shard_path(user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write_file(path, {'user_id': user_id, 'wallets': wallets})
+
+    # PortfolioRepository
+
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        return self._read_shard(int(user_id))
+
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        user_id = int(user_id)
+        with self._bucket_lock(self._bucket(user_id)):
+            current = self._read_shard(user_id)
+            current.update({code: float(balance) for code, balance in wallets.items()})
+            self._write_shard(user_id, current)
+
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        user_id = int(user_id)
+        with self._bucket_lock(self._bucket(user_id)):
+            wallets = self._read_shard(user_id)
+            for code, delta in deltas.items():
+                wallets[code] = wallets.get(code, 0.0) + delta
+            self._write_shard(user_id, wallets)
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        def add_deltas(wallets, deltas):
+            for code, delta in deltas.items():
+                wallets[code] = wallets.get(code, 0.0) + float(delta)
+        self._write_batch(batch, add_deltas)
+
+    def create_portfolios_batch(self, portfolios: Dict[int, Dict[str, float]]):
+        def set_balances(wallets, balances):
+            wallets.update({code: float(balance) for code, balance in balances.items()})
+        self._write_batch(portfolios, set_balances)
+
+    def _write_batch(self, batch, update):
+        """
+        Меняет файлы многих пользователей: либо все, либо ни один.
+        update(wallets, изменения пользователя) правит копию его кошельков.
+
+        Берем блокировки всех затронутых каталогов (по возрастанию номера,
+        чтобы не было взаимоблокировок), считаем и пишем новые балансы во
+        временные файлы и только затем подменяем ими файлы пользователей.
+        Если подмена сорвалась на середине, уже замененные файлы
+        возвращаются к прежнему содержимому. Аварийное завершение процесса
+        между подменами так не откатить — для этого нужен журнал
+        (JournalPortfolioRepository).
+        """
+        batch = {int(user_id): changes for user_id, changes in batch.items()}
+        prepared = []  # (user_id, путь, временный файл, прежние кошельки или None)
+        with ExitStack() as stack:
+            for bucket in sorted({self._bucket(user_id) for user_id in batch}):
+                stack.enter_context(self._bucket_lock(bucket))
+            try:
+                for user_id, changes in batch.items():
+                    path = self._shard_path(user_id)
+                    previous = self._read_shard(user_id) if os.path.exists(path) else None
+                    wallets = dict(previous or {})
+                    update(wallets, changes)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.batch"
+                    prepared.append((user_id, path, tmp_path, previous))
+                    with open(tmp_path, 'w') as f:
+                        json.dump({'user_id': user_id, 'wallets': wallets}, f)
+            except Exception:
+                for *_, tmp_path, _ in prepared:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                raise
+
+            replaced = []
+            try:
+                for user_id, path, tmp_path, previous in prepared:
+                    os.replace(tmp_path, path)
+                    replaced.append((user_id, path, previous))
+            except Exception:
+                for user_id, path, previous in replaced:
+                    if previous is None:
+                        os.remove(path)
+                    else:
+                        self._write_file(path, {'user_id': user_id, 'wallets': previous})
+                for *_, tmp_path, _ in prepared:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                raise
+
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        for bucket in range(self.buckets):
+            bucket_dir = os.path.join(self.shards_dir, f"{bucket:03x}")
+            if not os.path.isdir(bucket_dir):
+                continue
+            for name in sorted(os.listdir(bucket_dir)):
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(bucket_dir, name), 'r') as f:
+                    entry = json.load(f)
+                for code, balance in entry['wallets'].items():
+                    yield entry['user_id'], code, balance
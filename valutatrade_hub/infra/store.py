@@ -0,0 +1,267 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from valutatrade_hub.core.wallet_table import WalletTable
+from valutatrade_hub.infra import settings
+from valutatrade_hub.infra.database import PortfolioRepository, UserRepository, load_json
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+PORTFOLIOS_FILE = config.get('portfolios_path', 'data/portfolios.json')
+FLUSH_INTERVAL = config.get('store_flush_interval', 5.0)  # секунды
+FLUSH_DIRTY = config.get('store_flush_dirty', 100)  # число изменённых пользователей
+
+
+class PortfolioStore(PortfolioRepository):
+    """
+    Портфели в памяти с отложенной записью (write-behind).
+
+    portfolios.json читается один раз. Изменения копятся в памяти, а файл
+    перезаписывается пачкой: когда изменённых пользователей набралось
+    flush_dirty или прошло flush_interval секунд с последней записи.
+    Сериализуются заново только изменённые пользователи.
+    Балансы лежат в WalletTable (столбцы array), а не в объектах Wallet.
+    """
+
+    def __init__(self, portfolios_path: str = PORTFOLIOS_FILE,
+                 flush_interval: float = FLUSH_INTERVAL, flush_dirty: int = FLUSH_DIRTY):
+        self.portfolios_path = portfolios_path
+        self.flush_interval = flush_interval
+        self.flush_dirty = flush_dirty
+        self._lock = threading.RLock()
+        self._encoded: Dict[int, str] = {}  # сериализованные записи по user_id
+        self._dirty = set()
+        self._last_flush = time.monotonic()
+        self.flush_count = 0
+
+        entries = load_json(portfolios_path)
+        self._table = WalletTable.from_wallets(
+            (entry['user_id'], code, data['balance'])
+            for entry in entries for code, data in entry['wallets'].items()
+        )
+        for entry in entries:
+            user_id = int(entry['user_id'])
+            self._encoded[user_id] = self._encode(user_id)
+
+        self._stop = threading.Event()
+        self._timer = None
+        if flush_interval and flush_interval > 0:
+            self._timer = threading.Thread(target=self._run_timer, daemon=True)
+            self._timer.start()
+        atexit.register(self.close)
+
+    def _encode(self, user_id: int) -> str:
+        return json.dumps({
+            'user_id': user_id,
+            'wallets': {code: {'balance': balance} for code, balance in self._table.user_wallets(user_id).items()},
+        }, indent=4)
+
+    def _mark_dirty(self, user_id: int):
+        self._dirty.add(user_id)
+        if len(self._dirty) >= self.flush_dirty:
+            self.flush()
+
+    def _run_timer(self):
+        while not self._stop.wait(self.flush_interval):
+            if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    # PortfolioRepository
+
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        with self._lock:
+            return self._table.user_wallets(user_id)
+
+    def get_balance(self, user_id: int, currency_code: str):
+        with self._lock:
+            return self._table.get_balance(user_id, currency_code)
+
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        with self._lock:
+            for code, balance in wallets.items():
+                self._table.add(user_id, code, float(balance))
+            self._mark_dirty(int(user_id))
+
+    def create_portfolios_batch(self, portfolios: Dict[int, Dict[str, float]]):
+        with self._lock:
+            for user_id, wallets in portfolios.items():
+                for code, balance in wallets.items():
+                    self._table.add(user_id, code, float(balance))
+                self._dirty.add(int(user_id))
+            if len(self._dirty) >= self.flush_dirty:
+                self.flush()
+
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        self.apply_deltas_batch({user_id: deltas})
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        with self._lock:
+            # Сначала проверяем все списания, чтобы не применить пакет наполовину
+            for user_id, deltas in batch.items():
+                for code, delta in deltas.items():
+                    if delta < 0:
+                        balance = self._table.get_balance(user_id, code)
+                        if balance is None or -delta > balance:
+                            raise ValueError("Недостаточно средств на балансе.")
+            for user_id, deltas in batch.items():
+                for code, delta in deltas.items():
+                    if delta > 0:
+                        self._table.deposit(user_id, code, delta)
+                    elif delta < 0:
+                        self._table.withdraw(user_id, code, -delta)
+                    elif self._table.row(user_id, code) is None:
+                        self._table.add(user_id, code)
+                self._dirty.add(int(user_id))
+            if len(self._dirty) >= self.flush_dirty:
+                self.flush()
+
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        with self._lock:
+            items = list(self._table.iter_wallets())
+        return iter(items)
+
+    def to_wallet_arrays(self):
+        """Массивы для core/valuation без промежуточных кортежей (см. valuation.load_wallet_arrays)."""
+        with self._lock:
+            return self._table.to_wallet_arrays()
+
+    def flush(self):
+        """Записывает портфели во временный файл и атомарно подменяет portfolios.json."""
+        with self._lock:
+            if not self._dirty:
+                return
+            for user_id in self._dirty:
+                self._encoded[user_id] = self._encode(user_id)
+            payload = '[\n' + ',\n'.join(self._encoded.values()) + '\n]'
+            directory = os.path.dirname(self.portfolios_path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.portfolios_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.portfolios_path)
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+            self.flush_count += 1
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+class BufferedPortfolioRepository(PortfolioRepository):
+    """
+    Пакетный режим поверх любого хранилища портфелей.
+
+    Все кошельки читаются из исходного репозитория один раз, сделки
+    применяются в памяти, а в исходный репозиторий уходят суммарные
+    приращения по пользователям: каждые commit_every операций
+    (0 — только при flush/close). Балансы в памяти — WalletTable.
+    """
+
+    def __init__(self, inner: PortfolioRepository, commit_every: int = 0):
+        self.inner = inner
+        self.commit_every = commit_every
+        self._lock = threading.RLock()
+        self._created: Dict[int, Dict[str, float]] = {}  # новые портфели
+        self._pending: Dict[int, Dict[str, float]] = {}  # накопленные приращения
+        self.operations = 0
+        self.commit_count = 0
+        self._table = WalletTable.from_wallets(inner.iter_wallets())
+
+    def _count_operation(self):
+        self.operations += 1
+        if self.commit_every and self.operations % self.commit_every == 0:
+            self.flush()
+
+    def get_wallets(self, user_id: int) -> Dict[str, float]:
+        with self._lock:
+            return self._table.user_wallets(user_id)
+
+    def get_balance(self, user_id: int, currency_code: str):
+        with self._lock:
+            return self._table.get_balance(user_id, currency_code)
+
+    def create_portfolio(self, user_id: int, wallets: Dict[str, float]):
+        user_id = int(user_id)
+        with self._lock:
+            wallets = {code: float(balance) for code, balance in wallets.items()}
+            for code, balance in wallets.items():
+                self._table.add(user_id, code, balance)
+            self._created.setdefault(user_id, {}).update(wallets)
+            # Приращения, накопленные до пересоздания, уже не нужны
+            self._pending.pop(user_id, None)
+            self._count_operation()
+
+    def apply_deltas(self, user_id: int, deltas: Dict[str, float]):
+        self.apply_deltas_batch({user_id: deltas})
+
+    def apply_deltas_batch(self, batch: Dict[int, Dict[str, float]]):
+        with self._lock:
+            table = self._table
+            for user_id, deltas in batch.items():
+                for code, delta in deltas.items():
+                    if delta < 0 and -delta > (table.get_balance(user_id, code) or 0.0):
+                        raise ValueError("Недостаточно средств на балансе.")
+            for user_id, deltas in batch.items():
+                pending = self._pending.setdefault(int(user_id), {})
+                for code, delta in deltas.items():
+                    row = table.row(user_id, code)
+                    if row is None:
+                        row = table.add(user_id, code)
+                    table.balances[row] += delta
+                    pending[code] = pending.get(code, 0.0) + delta
+            self._count_operation()
+
+    def iter_wallets(self) -> Iterator[Tuple[int, str, float]]:
+        with self._lock:
+            items = list(self._table.iter_wallets())
+        return iter(items)
+
+    def to_wallet_arrays(self):
+        with self._lock:
+            return self._table.to_wallet_arrays()
+
+    def flush(self):
+        """
+        Переносит накопленные изменения в исходный репозиторий: новые портфели
+        одной записью, затем приращения одной записью. Каждая часть очищается
+        сразу после успешной записи, поэтому при сбое на приращениях повторный
+        flush не создает портфели заново.
+        """
+        with self._lock:
+            if not self._created and not self._pending:
+                return
+            if self._created:
+                self.inner.create_portfolios_batch(self._created)
+                self._created.clear()
+            if self._pending:
+                self.inner.apply_deltas_batch(self._pending)
+                self._pending.clear()
+            self.inner.flush()
+            self.commit_count += 1
+
+
+class CachedUserRepository(UserRepository):
+    """Запоминает найденных пользователей, чтобы пакетный режим не перечитывал хранилище."""
+
+    def __init__(self, inner: UserRepository):
+        self.inner = inner
+        self._by_username: Dict[str, Optional[dict]] = {}
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        if username not in self._by_username:
+            self._by_username[username] = self.inner.get_by_username(username)
+        return self._by_username[username]
+
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        return self.inner.get_by_id(user_id)
+
+    def add_user(self, username: str, hashed_password: str, registration_date: str) -> int:
+        self._by_username.pop(username, None)
+        return self.inner.add_user(username, hashed_password, registration_date)
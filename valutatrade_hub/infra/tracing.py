@@ -0,0 +1,217 @@
+"""
+Легковесная трассировка без внешних зависимостей.
+
+    with tracing.span('rates.fetch', client='CoinGeckoClient') as s:
+        ...
+        s.set_attribute('pairs', 3)
+
+Спаны вкладываются друг в друга через contextvars (parent_id), завершенные
+спаны пишутся пачками в JSONL (tracing_path). Пока трассировка выключена,
+span() возвращает общий пустой объект и почти ничего не стоит.
+Файл можно перевести в формат Chrome Trace (chrome://tracing, Perfetto,
+speedscope) для просмотра в виде flame/timeline:
+
+    python -m valutatrade_hub.infra.tracing traces/spans.jsonl traces/spans.chrome.json
+"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from valutatrade_hub.infra import settings
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+TRACING_ENABLED = config.get('tracing_enabled', False)
+TRACING_PATH = config.get('tracing_path', 'traces/spans.jsonl')
+TRACING_BUFFER = config.get('tracing_buffer', 256)  # спанов в памяти до записи в файл
+
+_current = contextvars.ContextVar('valutatrade_span', default=None)
+_enabled = False
+
+
+def _new_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes',
+                 'start_ns', 'duration_ns', 'status', '_token')
+
+    def __init__(self, name: str, attributes: dict):
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent is not None else _new_id()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = _new_id()
+        self.name = name
+        self.attributes = attributes
+        self.status = 'ok'
+        self.duration_ns = 0
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ns = time.time_ns() - self.start_ns
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.status = 'error'
+            self.attributes['error'] = f"{exc_type.__name__}: {exc}"
+        _exporter.export(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_us': self.start_ns // 1000,
+            'duration_us': self.duration_ns // 1000,
+            'thread': threading.current_thread().name,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Пустой спан для выключенной трассировки."""
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class JsonlExporter:
+    """Копит завершенные спаны и дописывает их в JSONL пачками."""
+
+    def __init__(self, path: str = TRACING_PATH, buffer_size: int = TRACING_BUFFER):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        record = span.to_dict()
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.buffer_size:
+                self._write()
+
+    def _write(self):
+        # Сериализация — только при записи пачки, не при закрытии каждого спана
+        if not self._buffer:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n'
+                            for record in self._buffer))
+        self._buffer.clear()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+
+_exporter = JsonlExporter()
+
+
+def span(name: str, **attributes):
+    """Контекстный менеджер спана; при выключенной трассировке — пустой объект."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def bind(func):
+    """
+    Привязывает func к текущему контексту трассировки, чтобы спаны,
+    открытые в другом потоке (ThreadPoolExecutor), получили верного родителя.
+    """
+    if not _enabled:
+        return func
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def enable(path: str = None):
+    """Включает трассировку; path — файл JSONL (по умолчанию tracing_path)."""
+    global _enabled
+    if path is not None and path != _exporter.path:
+        _exporter.flush()
+        _exporter.path = path
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _exporter.flush()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def flush():
+    _exporter.flush()
+
+
+atexit.register(flush)
+if TRACING_ENABLED:
+    enable()
+
+
+def to_chrome_trace(jsonl_path: str, output_path: str) -> int:
+    """Переводит JSONL спанов в формат Chrome Trace Event. Возвращает число спанов."""
+    events = []
+    threads = {}
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            tid = threads.setdefault(record['thread'], len(threads) + 1)
+            events.append({
+                'name': record['name'],
+                'cat': record['name'].split('.')[0],
+                'ph': 'X',
+                'ts': record['start_us'],
+                'dur': record['duration_us'],
+                'pid': 1,
+                'tid': tid,
+                'args': dict(record['attributes'], trace_id=record['trace_id'],
+                             span_id=record['span_id'], parent_id=record['parent_id']),
+            })
+    for thread_name, tid in threads.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread_name}})
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events}, f)
+    return len(events) - len(threads)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Использование: python -m valutatrade_hub.infra.tracing <spans.jsonl> <trace.json>")
+        sys.exit(2)
+    count = to_chrome_trace(sys.argv[1], sys.argv[2])
+    print(f"Спанов: {count}; откройте {sys.argv[2]} в chrome://tracing или ui.perfetto.dev")
@@ -1,11 +1,199 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+from valutatrade_hub.infra import settings
+
+config = settings.SettingsLoader()  # Создаст или вернет существующий экземпляр
+
+LOG_PATH = config.get('actions_log_path', 'logs/actions.log')
+LOG_QUEUE_SIZE = config.get('log_queue_size', 10000)      # записей в очереди, дальше — отбрасываем
+LOG_BATCH_SIZE = config.get('log_batch_size', 256)        # записей за одну запись в файл
+LOG_FLUSH_INTERVAL = config.get('log_flush_interval', 0.5)  # секунды
+# Доля сохраняемых записей для частых действий: {"GET_RATE": 0.1} — каждая десятая
+LOG_SAMPLE_RATES = config.get('log_sample_rates', {'GET_RATE': 0.1})
 
 logger = logging.getLogger('actions')
 logger.setLevel(logging.INFO)
 
-handler = RotatingFileHandler('logs/actions.log', maxBytes=10**6, backupCount=5)
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-handler.setFormatter(formatter)
 
-logger.addHandler(handler)
\ No newline at end of file
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень и поля из extra={'fields': {...}}."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry['message'] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей для действий из sample_rates (каждую N-ю)."""
+
+    def __init__(self, sample_rates: dict):
+        super().__init__()
+        self.every = {action: max(1, round(1 / rate)) for action, rate in sample_rates.items() if rate > 0}
+        self.dropped = {action for action, rate in sample_rates.items() if rate <= 0}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        action = (getattr(record, 'fields', None) or {}).get('action')
+        if action in self.dropped:
+            return False
+        every = self.every.get(action)
+        if every is None or every == 1:
+            return True
+        with self._lock:
+            count = self._counters.get(action, 0)
+            self._counters[action] = count + 1
+        if count % every:
+            return False
+        record.fields['sample_rate'] = 1 / every
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Кладет запись в ограниченную очередь; если очередь полна — отбрасывает, а не ждет."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Форматирование — в фоновом потоке, здесь запись передается как есть
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler, который пишет пачку строк за одну операцию."""
+
+    def emit_batch(self, lines):
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0:
+                self.stream.seek(0, 2)
+                if self.stream.tell() and self.stream.tell() + sum(len(line) + 1 for line in lines) >= self.maxBytes:
+                    self.doRollover()
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        finally:
+            self.release()
+
+
+class LogWriter(threading.Thread):
+    """Фоновый поток: забирает записи из очереди и пишет их в файл пачками."""
+
+    _STOP = object()
+
+    def __init__(self, log_queue, handler, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while True:
+                if record is self._STOP:
+                    stopping = True
+                else:
+                    batch.append(record)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.handler.format(record))
+            except Exception:
+                self.handler.handleError(record)
+        if lines:
+            self.handler.emit_batch(lines)
+            self.written += len(lines)
+
+    def stop(self, timeout=5.0):
+        # Очередь может быть полна — сигнал остановки ждет места
+        self.queue.put(self._STOP)
+        self.join(timeout)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def setup_logging(log_path: str = LOG_PATH, queue_size: int = LOG_QUEUE_SIZE,
+                  batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                  sample_rates: dict = None):
+    """
+    Подключает к логгеру 'actions' неблокирующий конвейер:
+    очередь (не больше queue_size записей) -> фоновый поток -> JSON-строки в log_path.
+    Повторный вызов возвращает уже созданный конвейер.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        file_handler = BatchRotatingFileHandler(log_path, maxBytes=10**6, backupCount=5, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES if sample_rates is None else sample_rates))
+        writer = LogWriter(log_queue, file_handler, batch_size, flush_interval)
+        writer.start()
+
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+        _pipeline = (queue_handler, writer)
+        atexit.register(shutdown_logging)
+        return _pipeline
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            return
+        queue_handler, writer = _pipeline
+        logger.removeHandler(queue_handler)
+        writer.stop()
+        writer.handler.close()
+        _pipeline = None
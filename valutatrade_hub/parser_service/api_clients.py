@@ -1,77 +1,346 @@
+import json
+import os
+import threading
+import time
 import requests
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
 from .config import ParserConfig
+from .provider_stats import RequestStats, provider_stats
+from .rate_limiter import RateLimitExceeded, get_bucket
+from valutatrade_hub.infra import tracing
 
 config = ParserConfig()
 # Исключение для ошибок API-запросов
 class ApiRequestError(Exception):
     pass
 
-# Маппинг криптовалютных ID для CoinGecko
-crypto_ids = config.CRYPTO_ID_MAP
+# Общая сессия: keep-alive соединения переиспользуются между запросами и клиентами
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+class ResponseCache:
+    """
+    Кеш ответов на диске: для каждого URL хранит ETag, Last-Modified
+    и тело последнего ответа 200, чтобы отвечать на 304 Not Modified.
+    """
+
+    def __init__(self, path: str = config.HTTP_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            else:
+                self._entries = {}
+        return self._entries
+
+    def get(self, url: str):
+        with self._lock:
+            return self._load().get(url)
+
+    def put(self, url: str, etag: str, last_modified: str, payload):
+        with self._lock:
+            entries = self._load()
+            entries[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "payload": payload,
+                "fetched_at": datetime.now(timezone.utc).isoformat(),
+            }
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+
+response_cache = ResponseCache()
+_stats_lock = threading.Lock()
+
 # Базовый абстрактный класс
 class BaseApiClient(ABC):
-    @abstractmethod
+    timeout = config.REQUEST_TIMEOUT
+    max_retries = config.MAX_RETRIES
+    # Лимиты провайдера: (запросов, за секунд) и квота (запросов, за секунд); None — без ограничений
+    RATE_LIMIT = None
+    QUOTA = None
+    # Флаги последнего запроса: 304 (курсы не изменились) и ETag ответа
+    not_modified = False
+    last_etag = ""
+    # Замер последнего вызова fetch_rates()
+    last_request = None
+    # time.monotonic(), к которому должен завершиться текущий fetch_rates(); None — без срока.
+    # Выставляет RatesUpdater, чтобы поток опроса не работал дольше общего лимита обновления
+    deadline = None
+
     def fetch_rates(self) -> dict:
+        """
+        Вызывает _fetch_rates() и замеряет статус, размер ответа и число повторов.
+        Время HTTP-запросов, ожидание лимитера и паузы между повторами
+        считает _send() — каждое в своем поле RequestStats.
+        """
+        self._stats = RequestStats(
+            provider=self.__class__.__name__,
+            timestamp=datetime.now(timezone.utc).isoformat(),
+        )
+        with tracing.span('api.fetch_rates', provider=self.__class__.__name__) as fetch_span:
+            try:
+                rates = self._fetch_rates()
+                self._stats.ok = True
+                fetch_span.set_attribute('pairs', len(rates))
+                return rates
+            except Exception as e:
+                self._stats.error = str(e)
+                raise
+            finally:
+                self.last_request = self._stats
+                provider_stats.record(self._stats)
+
+    @abstractmethod
+    def _fetch_rates(self) -> dict:
         pass
 
+    @property
+    def limiter(self):
+        if self.RATE_LIMIT is None:
+            return None
+        return get_bucket(self.__class__.__name__, self.RATE_LIMIT, self.QUOTA)
+
+    def requests_per_fetch(self) -> int:
+        """Сколько HTTP-запросов делает один fetch_rates() без повторов."""
+        return 1
+
+    def min_interval(self) -> float:
+        """Наименьший интервал между обновлениями, при котором квота не кончается раньше срока."""
+        if self.QUOTA is None:
+            return 0.0
+        quota, period = self.QUOTA
+        return period / quota * self.requests_per_fetch()
+
+    def quota_status(self) -> dict:
+        """Свободные токены и остаток квоты провайдера."""
+        limiter = self.limiter
+        return limiter.status() if limiter is not None else {}
+
+    def _remaining(self):
+        """Секунд до self.deadline (None — срока нет); если срок вышел — ApiRequestError."""
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise ApiRequestError(f'{self.__class__.__name__}: истек срок обновления курсов')
+        return remaining
+
+    def _send(self, url: str, headers: dict):
+        """GET с повторами при сетевых ошибках, 429 и 5xx; ожидание и повторы не выходят за self.deadline."""
+        delay = config.RETRY_BACKOFF
+        limiter = self.limiter
+        stats = getattr(self, '_stats', None)
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                remaining = self._remaining()
+                wait = config.LIMITER_MAX_WAIT if remaining is None else min(config.LIMITER_MAX_WAIT, remaining)
+                # Ждем токен (или получаем отказ) до обращения к сети
+                started = time.perf_counter()
+                try:
+                    with tracing.span('api.rate_limit_wait', provider=self.__class__.__name__):
+                        limiter.acquire(block=True, timeout=wait)
+                finally:
+                    self._add_stats('limiter_wait_ms', (time.perf_counter() - started) * 1000)
+            remaining = self._remaining()
+            timeout = self.timeout if remaining is None else min(self.timeout, remaining)
+            if stats is not None:
+                with _stats_lock:
+                    stats.requests += 1
+                    stats.retries += 1 if attempt else 0
+            # В duration_ms идет только сам запрос: задержки провайдеров сравниваются без нашего троттлинга
+            started = time.perf_counter()
+            try:
+                with tracing.span('http.get', provider=self.__class__.__name__, attempt=attempt) as http_span:
+                    response = get_session().get(url, headers=headers, timeout=timeout)
+                    http_span.set_attribute('status_code', response.status_code)
+            except requests.exceptions.RequestException:
+                self._add_stats('duration_ms', (time.perf_counter() - started) * 1000)
+                if attempt == self.max_retries:
+                    raise
+            else:
+                self._add_stats('duration_ms', (time.perf_counter() - started) * 1000)
+                if (response.status_code != 429 and response.status_code < 500) or attempt == self.max_retries:
+                    if stats is not None:
+                        with _stats_lock:
+                            stats.status_code = response.status_code
+                            stats.payload_bytes += len(response.content)
+                    return response
+            remaining = self._remaining()
+            started = time.perf_counter()
+            time.sleep(delay if remaining is None else min(delay, remaining))
+            self._add_stats('backoff_ms', (time.perf_counter() - started) * 1000)
+            delay *= 2
+
+    def _add_stats(self, field: str, value: float):
+        """Прибавляет value к полю замера текущего fetch_rates() (пачки CoinGecko пишут из разных потоков)."""
+        stats = getattr(self, '_stats', None)
+        if stats is not None:
+            with _stats_lock:
+                setattr(stats, field, getattr(stats, field) + value)
+
+    def _get_json(self, url: str, params=None, headers=None):
+        """
+        GET через общую сессию с условными заголовками If-None-Match / If-Modified-Since.
+        На 304 возвращает тело из кеша ответов и выставляет self.not_modified.
+        """
+        payload, self.not_modified, self.last_etag = self._request_json(url, params, headers)
+        return payload
+
+    def _request_json(self, url: str, params=None, headers=None):
+        """То же, что _get_json, но без побочных эффектов: (тело, 304?, ETag). Безопасно из потоков."""
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        headers = dict(headers or {})
+        cached = response_cache.get(full_url)
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self._send(full_url, headers)
+        if response.status_code == 304 and cached:
+            return cached['payload'], True, cached.get('etag') or ""
+        if response.status_code != 200:
+            raise ApiRequestError(f'{self.__class__.__name__} error: status code {response.status_code}')
+
+        payload = response.json()
+        etag = response.headers.get('ETag', "")
+        last_modified = response.headers.get('Last-Modified', "")
+        if etag or last_modified:
+            response_cache.put(full_url, etag, last_modified, payload)
+        return payload, False, etag
+
 # Реализация CoinGeckoClient
 class CoinGeckoClient(BaseApiClient):
     BASE_URL = config.COINGECKO_URL
+    RATE_LIMIT = (30, 60)                # бесплатный тариф: ~30 запросов в минуту
+    QUOTA = (10000, 30 * 24 * 3600)      # и 10 000 в месяц
 
-    print(BASE_URL)
-    print(crypto_ids.values())
     def __init__(self, crypto_ids=None, vs_currencies=None):
-        # Например, по умолчанию
-        # Маппинг криптовалютных ID для CoinGecko
-        crypto_ids = config.CRYPTO_ID_MAP
+        """
+        :param crypto_ids: {символ: id CoinGecko} (по умолчанию CRYPTO_ID_MAP) или список id;
+            для id из списка символ берется из CRYPTO_ID_MAP, иначе — id в верхнем регистре
+        """
+        if crypto_ids is None:
+            crypto_ids = config.CRYPTO_ID_MAP
+        if not isinstance(crypto_ids, dict):
+            known = {coin_id: symbol for symbol, coin_id in config.CRYPTO_ID_MAP.items()}
+            crypto_ids = {known.get(coin_id, coin_id.upper()): coin_id for coin_id in crypto_ids}
         self.crypto_ids = list(crypto_ids.values())
+        # id CoinGecko -> символ валюты: пары возвращаются как BTC_USD, а не BITCOIN_USD
+        self.symbols = {coin_id: symbol.upper() for symbol, coin_id in crypto_ids.items()}
         self.vs_currencies = vs_currencies or ['usd']
-    
-    def fetch_rates(self) -> dict:
+        self.max_url_length = config.COINGECKO_MAX_URL_LENGTH
+        self.batch_workers = config.COINGECKO_BATCH_WORKERS
+        # Ошибки по отдельным id в последнем запросе: {id: причина}
+        self.last_errors = {}
+
+    def _batches(self):
+        """Делит список id на пачки так, чтобы URL запроса не превышал max_url_length."""
+        vs = ','.join(self.vs_currencies)
+        base_length = len(self.BASE_URL) + len('?ids=&vs_currencies=') + len(quote(vs))
+        batches, current, length = [], [], base_length
+        for crypto in self.crypto_ids:
+            item_length = len(quote(crypto)) + (len('%2C') if current else 0)
+            if current and length + item_length > self.max_url_length:
+                batches.append(current)
+                current, length = [], base_length
+                item_length = len(quote(crypto))
+            current.append(crypto)
+            length += item_length
+        if current:
+            batches.append(current)
+        return batches
+
+    def requests_per_fetch(self) -> int:
+        return len(self._batches())
+
+    def _fetch_batch(self, batch):
         params = {
-            'ids': ','.join(self.crypto_ids),
+            'ids': ','.join(batch),
             'vs_currencies': ','.join(self.vs_currencies),
         }
-        try:
-            response = requests.get(self.BASE_URL, params=params, timeout=10)
-            print(response)
-            if response.status_code != 200:
-                raise ApiRequestError(f'CoinGecko API error: status code {response.status_code}')
-            data = response.json()
-            # преобразуем в стандартный формат: {"BTC_USD": value, ...}
-            rates = {}
-            for crypto in self.crypto_ids:
+        return self._request_json(self.BASE_URL, params=params)
+
+    def _fetch_rates(self) -> dict:
+        batches = self._batches()
+        self.last_errors = {}
+        results = [None] * len(batches)
+        workers = max(1, min(self.batch_workers, len(batches)))
+        # Пачки запрашиваются параллельно; лимитер в _send общий для всех потоков
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='coingecko') as executor:
+            fetch_batch = tracing.bind(self._fetch_batch)
+            futures = {executor.submit(fetch_batch, batch): i for i, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except (ApiRequestError, RateLimitExceeded, requests.exceptions.RequestException) as e:
+                    for crypto in batches[i]:
+                        self.last_errors[crypto] = f'Request failed: {e}'
+
+        # преобразуем в стандартный формат: {"BTC_USD": value, ...}
+        rates = {}
+        for batch, result in zip(batches, results):
+            if result is None:
+                continue
+            data = result[0]
+            for crypto in batch:
                 for currency in self.vs_currencies:
-                    key = f"{crypto.upper()}_{currency.upper()}"
+                    key = f"{self.symbols[crypto]}_{currency.upper()}"
                     value = data.get(crypto, {}).get(currency)
                     if value is None:
-                        raise ApiRequestError(f'Missing data for {key}')
+                        self.last_errors[crypto] = f'Missing data for {key}'
+                        continue
                     rates[key] = value
-            return rates
-        except requests.exceptions.RequestException as e:
-            raise ApiRequestError(f'Request failed: {e}')
+
+        answered = [result for result in results if result is not None]
+        self.not_modified = bool(answered) and all(result[1] for result in answered)
+        self.last_etag = answered[0][2] if len(answered) == 1 else ""
+        if not rates:
+            raise ApiRequestError(f'No data for any id: {self.last_errors}')
+        return rates
 
 # Реализация ExchangeRateApiClient
 class ExchangeRateApiClient(BaseApiClient):
     BASE_URL = config.EXCHANGERATE_API_URL
-    print(BASE_URL)
+    RATE_LIMIT = (10, 60)
+    QUOTA = (1500, 30 * 24 * 3600)       # бесплатный ключ: 1500 запросов в месяц
+
     def __init__(self, api_key: str, base_currency: str = 'USD'):
         self.api_key = api_key
         self.base_currency = base_currency.upper()
 
-    def fetch_rates(self) -> dict:
+    def _fetch_rates(self) -> dict:
         url = self.BASE_URL.format(self.base_currency)
-        print('ExchangeRateApiClient')
-        print(url)
         headers = {
             'Authorization': f'Bearer {self.api_key}'
         }
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code != 200:
-                raise ApiRequestError(f'ExchangeRate API error: status code {response.status_code}')
-            data = response.json()
+            data = self._get_json(url, headers=headers)
             # print(data)
             rates_data = data.get('conversion_rates')
             if rates_data is None:
@@ -7,22 +7,61 @@ class ParserConfig:
     EXCHANGERATE_API_KEY: str = os.getenv("EXCHANGERATE_API_KEY")
 
     # Эндпоинты
-    COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin,ethereum,solana&vs_currencies=usd"
+    COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price"
     EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6/d0af525c6a4bf3b4d762c196/latest/USD"
 
     # Списки валют
     BASE_CURRENCY: str = "USD"
     FIAT_CURRENCIES: tuple = ("EUR", "GBP", "RUB")
     CRYPTO_CURRENCIES: tuple = ("BTC", "ETH", "SOL")
+    # Символ -> id CoinGecko: все отслеживаемые криптовалюты (CoinGeckoClient по умолчанию)
     CRYPTO_ID_MAP: dict = field(default_factory=lambda: {
         "BTC": "bitcoin",
         "ETH": "ethereum",
         "SOL": "solana",
     })
+    # Коды, которые отдает ExchangeRate-API (conversion_rates); вместе со
+    # списками выше из них строится справочник валют core/currencies.py
+    EXCHANGERATE_CODES: tuple = (
+        "AED", "AFN", "ALL", "AMD", "ANG", "AOA", "ARS", "AUD", "AWG", "AZN", "BAM", "BBD", "BDT", "BGN",
+        "BHD", "BIF", "BMD", "BND", "BOB", "BRL", "BSD", "BTN", "BWP", "BYN", "BZD", "CAD", "CDF", "CHF",
+        "CLF", "CLP", "CNH", "CNY", "COP", "CRC", "CUP", "CVE", "CZK", "DJF", "DKK", "DOP", "DZD", "EGP",
+        "ERN", "ETB", "EUR", "FJD", "FKP", "FOK", "GBP", "GEL", "GGP", "GHS", "GIP", "GMD", "GNF", "GTQ",
+        "GYD", "HKD", "HNL", "HRK", "HTG", "HUF", "IDR", "ILS", "IMP", "INR", "IQD", "IRR", "ISK", "JEP",
+        "JMD", "JOD", "JPY", "KES", "KGS", "KHR", "KID", "KMF", "KRW", "KWD", "KYD", "KZT", "LAK", "LBP",
+        "LKR", "LRD", "LSL", "LYD", "MAD", "MDL", "MGA", "MKD", "MMK", "MNT", "MOP", "MRU", "MUR", "MVR",
+        "MWK", "MXN", "MYR", "MZN", "NAD", "NGN", "NIO", "NOK", "NPR", "NZD", "OMR", "PAB", "PEN", "PGK",
+        "PHP", "PKR", "PLN", "PYG", "QAR", "RON", "RSD", "RUB", "RWF", "SAR", "SBD", "SCR", "SDG", "SEK",
+        "SGD", "SHP", "SLE", "SLL", "SOS", "SRD", "SSP", "STN", "SYP", "SZL", "THB", "TJS", "TMT", "TND",
+        "TOP", "TRY", "TTD", "TVD", "TWD", "TZS", "UAH", "UGX", "USD", "UYU", "UZS", "VES", "VND", "VUV",
+        "WST", "XAF", "XCD", "XCG", "XDR", "XOF", "XPF", "YER", "ZAR", "ZMW", "ZWG", "ZWL",
+    )
 
     # Пути
     RATES_FILE_PATH: str = "data/rates.json"
     HISTORY_FILE_PATH: str = "data/exchange_rates.json"
+    HTTP_CACHE_PATH: str = "data/http_cache.json"
+    PROVIDER_STATS_PATH: str = "data/provider_stats.json"
+    RATE_LIMIT_DIR: str = "data/ratelimit"
 
     # Сетевые параметры
-    REQUEST_TIMEOUT: int = 10
\ No newline at end of file
+    REQUEST_TIMEOUT: int = 10
+    REFRESH_DEADLINE: int = 15  # общий лимит на опрос всех источников, сек
+    HTTP_POOL_SIZE: int = 10
+    COINGECKO_MAX_URL_LENGTH: int = 2000  # длина URL одной пачки id
+    COINGECKO_BATCH_WORKERS: int = 4      # пачек, запрашиваемых одновременно
+    MAX_RETRIES: int = 2          # повторов при сетевой ошибке, 429 или 5xx
+    RETRY_BACKOFF: float = 0.5    # пауза перед повтором, удваивается, сек
+    STATS_WINDOW: int = 500       # замеров в скользящем окне задержек
+    LIMITER_MAX_WAIT: int = 30    # сколько ждать свободный токен лимитера, сек
+
+    # Расписание обновления (секунды)
+    DEFAULT_TTL: int = 3600
+    SOURCE_TTLS: dict = field(default_factory=lambda: {
+        "CoinGeckoClient": 300,         # крипта — раз в 5 минут (квота 10 000 запросов в месяц)
+        "ExchangeRateApiClient": 3600,  # фиат — раз в час
+    })
+    PAIR_TTLS: dict = field(default_factory=dict)  # например {"BTC_USD": 30}
+    SCHEDULER_JITTER: float = 0.1  # ±10% к интервалу
+    BACKOFF_BASE: int = 15         # первый повтор после ошибки
+    BACKOFF_MAX: int = 900
\ No newline at end of file
@@ -0,0 +1,142 @@
+import json
+import math
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+from .config import ParserConfig
+
+config = ParserConfig()
+
+
+@dataclass
+class RequestStats:
+    """Замер одного вызова fetch_rates()."""
+    provider: str
+    duration_ms: float = 0.0     # суммарное время HTTP-запросов (session.get), без ожиданий ниже
+    limiter_wait_ms: float = 0.0  # ожидание токена локального лимитера
+    backoff_ms: float = 0.0      # паузы между повторами
+    status_code: int = 0         # 0 — ответа не было (сетевая ошибка)
+    payload_bytes: int = 0
+    retries: int = 0
+    requests: int = 0            # HTTP-запросов за вызов
+    ok: bool = False
+    error: str = ""
+    timestamp: str = ""
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Перцентиль методом ближайшего ранга; q от 0 до 100."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LatencyHistogram:
+    """Скользящее окно последних замеров задержки одного провайдера."""
+
+    def __init__(self, window: int = config.STATS_WINDOW, samples=()):
+        self.samples = deque(samples, maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.payload_bytes = 0
+        self.limiter_wait_ms = 0.0
+        self.backoff_ms = 0.0
+        self.last = None
+
+    def add(self, stats: RequestStats):
+        self.samples.append(round(stats.duration_ms, 3))
+        self.requests += 1
+        self.errors += 0 if stats.ok else 1
+        self.retries += stats.retries
+        self.payload_bytes += stats.payload_bytes
+        self.limiter_wait_ms += stats.limiter_wait_ms
+        self.backoff_ms += stats.backoff_ms
+        self.last = asdict(stats)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        return {
+            "count": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_payload_bytes": self.payload_bytes // self.requests if self.requests else 0,
+            # Время, потраченное у нас (лимитер, паузы повторов), — отдельно от задержки провайдера
+            "avg_limiter_wait_ms": round(self.limiter_wait_ms / self.requests, 3) if self.requests else 0.0,
+            "avg_backoff_ms": round(self.backoff_ms / self.requests, 3) if self.requests else 0.0,
+            "p50_ms": percentile(ordered, 50),
+            "p95_ms": percentile(ordered, 95),
+            "p99_ms": percentile(ordered, 99),
+            "max_ms": ordered[-1] if ordered else 0.0,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "samples": list(self.samples),
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "payload_bytes": self.payload_bytes,
+            "limiter_wait_ms": self.limiter_wait_ms,
+            "backoff_ms": self.backoff_ms,
+            "last": self.last,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, window: int = config.STATS_WINDOW):
+        hist = cls(window, data.get("samples", []))
+        hist.requests = data.get("requests", 0)
+        hist.errors = data.get("errors", 0)
+        hist.retries = data.get("retries", 0)
+        hist.payload_bytes = data.get("payload_bytes", 0)
+        hist.limiter_wait_ms = data.get("limiter_wait_ms", 0.0)
+        hist.backoff_ms = data.get("backoff_ms", 0.0)
+        hist.last = data.get("last")
+        return hist
+
+
+class ProviderStats:
+    """Гистограммы задержек по провайдерам, сохраняемые в data/provider_stats.json."""
+
+    def __init__(self, path: str = config.PROVIDER_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._histograms = None
+
+    def _load(self):
+        if self._histograms is None:
+            data = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f).get("providers", {})
+            self._histograms = {name: LatencyHistogram.from_dict(h) for name, h in data.items()}
+        return self._histograms
+
+    def record(self, stats: RequestStats):
+        with self._lock:
+            histograms = self._load()
+            histograms.setdefault(stats.provider, LatencyHistogram()).add(stats)
+
+    def summaries(self) -> dict:
+        with self._lock:
+            return {name: h.summary() for name, h in self._load().items()}
+
+    def save(self):
+        with self._lock:
+            histograms = self._load()
+            data = {
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "providers": {name: h.to_dict() for name, h in histograms.items()},
+            }
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+
+provider_stats = ProviderStats()
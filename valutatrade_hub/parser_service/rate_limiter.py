@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from valutatrade_hub.infra.file_lock import file_lock
+
+from .config import ParserConfig
+
+config = ParserConfig()
+
+
+class RateLimitExceeded(Exception):
+    """Запрос к провайдеру отклонен лимитером до обращения к сети."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float = None):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"Лимит запросов {provider} исчерпан: {reason}")
+
+
+class TokenBucket:
+    """
+    Token bucket провайдера с состоянием в файле, общий для всех процессов.
+
+    capacity токенов восполняются за per_seconds; каждый HTTP-запрос берет
+    один токен. Дополнительно считается квота: не более quota запросов
+    за quota_period секунд (окно отсчитывается от первого запроса).
+    """
+
+    def __init__(self, provider: str, capacity: int, per_seconds: float,
+                 quota: int = None, quota_period: float = None,
+                 state_dir: str = config.RATE_LIMIT_DIR):
+        self.provider = provider
+        self.capacity = capacity
+        self.refill_rate = capacity / per_seconds
+        self.quota = quota
+        self.quota_period = quota_period
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, f"{provider}.json")
+        self.lock_path = self.state_path + '.lock'
+        self._thread_lock = threading.Lock()
+
+    def _load(self, now: float) -> dict:
+        state = None
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                try:
+                    state = json.load(f)
+                except ValueError:
+                    state = None
+        if state is None:
+            state = {"tokens": self.capacity, "updated": now, "quota_used": 0, "quota_start": now}
+        # Восполнение токенов за прошедшее время
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * self.refill_rate)
+        state["updated"] = now
+        if self.quota_period and now - state["quota_start"] >= self.quota_period:
+            state["quota_used"] = 0
+            state["quota_start"] = now
+        return state
+
+    def _save(self, state: dict):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock, file_lock(self.lock_path):
+            yield
+
+    def acquire(self, block: bool = True, timeout: float = None) -> float:
+        """
+        Берет один токен. Если токенов нет — ждет (block=True, не дольше timeout)
+        или сразу выбрасывает RateLimitExceeded. Исчерпанную квоту не ждем.
+        Возвращает оставшееся число токенов.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._locked():
+                now = time.time()
+                state = self._load(now)
+                if self.quota is not None and state["quota_used"] >= self.quota:
+                    self._save(state)
+                    retry_after = state["quota_start"] + self.quota_period - now
+                    raise RateLimitExceeded(self.provider, f"квота {self.quota} запросов", retry_after)
+                if state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    state["quota_used"] += 1
+                    self._save(state)
+                    return state["tokens"]
+                self._save(state)
+                wait = (1 - state["tokens"]) / self.refill_rate
+            if not block:
+                raise RateLimitExceeded(self.provider, "нет свободных токенов", wait)
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(self.provider, "превышено время ожидания токена", wait)
+            time.sleep(wait)
+
+    def status(self) -> dict:
+        with self._locked():
+            now = time.time()
+            state = self._load(now)
+        result = {
+            "tokens": round(state["tokens"], 2),
+            "capacity": self.capacity,
+        }
+        if self.quota is not None:
+            result.update({
+                "quota": self.quota,
+                "quota_used": state["quota_used"],
+                "quota_remaining": max(0, self.quota - state["quota_used"]),
+                "quota_resets_in": max(0.0, state["quota_start"] + self.quota_period - now),
+            })
+        return result
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider: str, rate_limit, quota=None) -> TokenBucket:
+    """Общий для процесса лимитер провайдера; rate_limit = (capacity, per_seconds), quota = (count, period)."""
+    with _buckets_lock:
+        if provider not in _buckets:
+            capacity, per_seconds = rate_limit
+            quota_count, quota_period = quota if quota else (None, None)
+            _buckets[provider] = TokenBucket(provider, capacity, per_seconds, quota_count, quota_period)
+        return _buckets[provider]
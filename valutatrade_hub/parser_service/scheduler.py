@@ -1,46 +1,148 @@
+import logging
+import os
+import random
 import threading
 import time
-from .updater import RatesUpdater  
-from .api_clients import CoinGeckoClient, ExchangeRateApiClient  
-from .storage import write_rates 
+from .updater import RatesUpdater
+from .api_clients import CoinGeckoClient, ExchangeRateApiClient
+from .config import ParserConfig
+from . import storage
+from valutatrade_hub.infra import metrics
 
-# Настройка клиентов
-coin_gecko_client = CoinGeckoClient()
-exchange_rate_client = ExchangeRateApiClient()  
+logger = logging.getLogger(__name__)
+config = ParserConfig()
 
-# Создаем объект хранилища
-class StorageWrapper:
-    def save(self, data):
-        write_rates(data)
 
-storage = StorageWrapper()
+def default_clients():
+    """Клиенты по умолчанию: крипта из CoinGecko, фиат из ExchangeRate-API."""
+    return [CoinGeckoClient(), ExchangeRateApiClient(os.getenv("EXCHANGERATE_API_KEY"))]
 
-# Создаем экземпляр обновления данных котировок
-rates_updater = RatesUpdater(
-    api_clients=[coin_gecko_client, exchange_rate_client],
-    storage=storage
-)
 
-def update_exchange_rates():
-    try:
-        rates_updater.run_update()
-        print("Курсы обновлены успешно.")
-    except Exception as e:
-        print(f"Ошибка при обновлении курсов: {e}")
-
-def periodic_update(interval_hours=1):
-    """Функция для периодического вызова обновления"""
-    while True:
-        update_exchange_rates()
-        # Ждем указанное количество часов
-        time.sleep(interval_hours * 3600)
+class SourceJob:
+    """Состояние расписания одного источника."""
+
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.name = client.__class__.__name__
+        self.ttl = ttl            # интервал обновления при успехе, сек
+        # Чаще обновлять нельзя: квота провайдера кончится раньше своего периода
+        self.min_interval = client.min_interval() if hasattr(client, 'min_interval') else 0.0
+        self.failures = 0         # подряд идущих неудач
+        self.next_run = 0.0       # time.monotonic(), когда пора обновлять
+        self.pairs = set()        # пары, которые источник вернул в последний раз
+
+
+class RefreshScheduler:
+    """
+    Планировщик обновления курсов с отдельным интервалом для каждого источника.
+
+    Интервал источника — его TTL из SOURCE_TTLS, но не больше наименьшего
+    TTL из PAIR_TTLS среди пар, которые он поставляет. К интервалу
+    добавляется случайный разброс (jitter), чтобы не бить в API синхронно.
+    После неудачи повтор идет через BACKOFF_BASE, 2×, 4× ... до BACKOFF_MAX.
+    Интервал никогда не меньше client.min_interval(): период квоты / квота ×
+    число запросов на одно обновление.
+    """
+
+    def __init__(self, api_clients=None, storage_backend=storage,
+                 source_ttls=None, pair_ttls=None, jitter=None,
+                 backoff_base=None, backoff_max=None):
+        self.storage = storage_backend
+        source_ttls = source_ttls if source_ttls is not None else config.SOURCE_TTLS
+        self.pair_ttls = pair_ttls if pair_ttls is not None else config.PAIR_TTLS
+        self.jitter = config.SCHEDULER_JITTER if jitter is None else jitter
+        self.backoff_base = backoff_base or config.BACKOFF_BASE
+        self.backoff_max = backoff_max or config.BACKOFF_MAX
+        self.jobs = [
+            SourceJob(client, source_ttls.get(client.__class__.__name__, config.DEFAULT_TTL))
+            for client in (api_clients if api_clients is not None else default_clients())
+        ]
+        for job in self.jobs:
+            if job.ttl < job.min_interval:
+                logger.warning(f"Интервал {job.name} {job.ttl:.0f} c не укладывается в квоту провайдера, "
+                               f"используется {job.min_interval:.0f} c")
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Расчет интервалов
+
+    def _interval(self, job: SourceJob) -> float:
+        ttl = job.ttl
+        for pair in job.pairs:
+            if pair in self.pair_ttls:
+                ttl = min(ttl, self.pair_ttls[pair])
+        return ttl
+
+    def _with_jitter(self, delay: float) -> float:
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _reschedule(self, job: SourceJob, ok: bool, now: float):
+        if ok:
+            job.failures = 0
+            delay = self._interval(job)
+        else:
+            job.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (job.failures - 1))
+            # Неудачные запросы тоже расходуют квоту
+            delay = max(delay, job.min_interval)
+            logger.warning(f"Источник {job.name} недоступен ({job.failures} раз подряд), "
+                           f"повтор через {delay:.0f} c")
+        job.next_run = now + max(self._with_jitter(delay), job.min_interval)
+
+    # Запуск
+
+    def run_due(self, now: float = None):
+        """Обновляет все источники, срок которых наступил. Возвращает их имена."""
+        now = time.monotonic() if now is None else now
+        due = [job for job in self.jobs if job.next_run <= now]
+        if not due:
+            return []
+        updater = RatesUpdater(api_clients=[job.client for job in due], storage=self.storage)
+        try:
+            status = updater.run_update() or {}
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении курсов: {e}")
+            status = {}
+        finished = time.monotonic()
+        for job in due:
+            job.pairs = updater.last_sources.get(job.name, job.pairs)
+            self._reschedule(job, status.get(job.name, False), finished)
+        return [job.name for job in due]
+
+    def _loop(self):
+        logger.info("Планировщик обновления курсов запущен.")
+        while not self._stop.is_set():
+            self.run_due()
+            wait = max(0.0, min(job.next_run for job in self.jobs) - time.monotonic())
+            self._stop.wait(wait)
+        logger.info("Планировщик обновления курсов остановлен.")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='rates-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
 
 if __name__ == "__main__":
-    # Запускаем поток, который будет обновлять курсы каждые 1 час
-    updater_thread = threading.Thread(target=periodic_update, args=(1,), daemon=True)
-    updater_thread.start()
-
-    # Можно оставить основной поток для выполнения других задач или просто ждать
-    # Например, чтобы программа не завершилась:
-    while True:
-        time.sleep(3600)
\ No newline at end of file
+    metrics.start_exporter()
+    scheduler = RefreshScheduler()
+    scheduler.start()
+    try:
+        while scheduler.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
@@ -1,11 +1,27 @@
 import os
 import json
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
 from valutatrade_hub.infra import settings
+from valutatrade_hub.infra import rates_cache
+from valutatrade_hub.infra.metrics import registry
+from valutatrade_hub.infra import tracing
 
 # Получение пути к файлу из настроек
 config = settings.SettingsLoader()
 RATES_FILE_PATH = config.get('path_to_json', "data/exchange_rates.json")
 SIMPLE_6_FILE_PATH = config.get('path_to_json', "data/rates.json")
+HISTORY_DIR = config.get('history_dir', "data/history")
+# Сколько индексов сегментов истории держать в памяти процесса
+HISTORY_INDEX_SEGMENTS = config.get('history_index_segments', 64)
+
+STORAGE_SECONDS = registry.histogram(
+    'valutatrade_storage_operation_seconds', 'Длительность операций хранилища курсов', ('operation',))
+HISTORY_RECORDS = registry.counter(
+    'valutatrade_storage_history_records_total', 'Записей, добавленных в историю курсов')
+HISTORY_MANIFEST_PATH = os.path.join(HISTORY_DIR, "manifest.json")
 def load_json(file_path):
     if os.path.exists(file_path):
         with open(file_path, 'r') as f:
@@ -15,16 +31,255 @@ def load_json(file_path):
 def save_json(file_path, data):
     with open(file_path, 'w') as f:
         json.dump(data, f, indent=4)
+# История курсов: сегменты по дням (JSONL, только дозапись) + манифест
+
+def _write_atomic(file_path, data):
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def to_epoch(timestamp: str) -> float:
+    """ISO-метка (с 'Z', смещением или без зоны — тогда UTC) -> секунды epoch."""
+    moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def _segment_name(timestamp: str) -> str:
+    # Дата UTC из ISO-метки: 2026-01-09T04:02:50+03:00 -> 2026-01-09.jsonl (01:02:50 UTC)
+    return datetime.fromtimestamp(to_epoch(timestamp), timezone.utc).strftime('%Y-%m-%d') + '.jsonl'
+
+def load_manifest():
+    """Манифест истории; при первом обращении переносит в сегменты старый exchange_rates.json."""
+    manifest = load_json(HISTORY_MANIFEST_PATH)
+    if manifest:
+        _recover_segments(manifest)
+        return manifest
+    manifest = {"segments": {}, "metadata": {}}
+    legacy = load_json(RATES_FILE_PATH)
+    if legacy.get('rates'):
+        _append_records(manifest, legacy['rates'])
+        manifest['metadata'] = legacy.get('metadata', {})
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    _write_atomic(HISTORY_MANIFEST_PATH, manifest)
+    return manifest
+
+def _recover_segments(manifest):
+    """Добавляет в манифест сегменты, созданные перед сбоем, но не успевшие в него попасть."""
+    for name in os.listdir(HISTORY_DIR):
+        if not name.endswith('.jsonl') or name in manifest['segments']:
+            continue
+        with open(os.path.join(HISTORY_DIR, name), 'r') as f:
+            timestamps = [json.loads(line)['timestamp'] for line in f if line.strip()]
+        if timestamps:
+            manifest['segments'][name] = {
+                "first_ts": min(timestamps, key=to_epoch), "last_ts": max(timestamps, key=to_epoch),
+                "count": len(timestamps),
+            }
+
+def _append_records(manifest, records):
+    """Дописывает записи в сегменты и обновляет описание сегментов в манифесте."""
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    by_segment = {}
+    for record in records:
+        by_segment.setdefault(_segment_name(record['timestamp']), []).append(record)
+    for name, segment_records in by_segment.items():
+        with open(os.path.join(HISTORY_DIR, name), 'a') as f:
+            f.write(''.join(json.dumps(r) + '\n' for r in segment_records))
+            f.flush()
+            os.fsync(f.fileno())
+        timestamps = [r['timestamp'] for r in segment_records]
+        info = manifest['segments'].setdefault(name, {
+            "first_ts": min(timestamps, key=to_epoch), "last_ts": max(timestamps, key=to_epoch), "count": 0,
+        })
+        # Метки сравниваются как моменты времени, а не как строки (смещения и 'Z' различаются)
+        info['first_ts'] = min(info['first_ts'], *timestamps, key=to_epoch)
+        info['last_ts'] = max(info['last_ts'], *timestamps, key=to_epoch)
+        info['count'] += len(segment_records)
+
+def list_segments(start: str = None, end: str = None):
+    """Имена сегментов, пересекающихся с интервалом [start, end] (ISO-метки с любой зоной)."""
+    manifest = load_manifest()
+    start_ts = to_epoch(start) if start is not None else None
+    end_ts = to_epoch(end) if end is not None else None
+    names = []
+    for name, info in sorted(manifest['segments'].items()):
+        if start_ts is not None and to_epoch(info['last_ts']) < start_ts:
+            continue
+        if end_ts is not None and to_epoch(info['first_ts']) > end_ts:
+            continue
+        names.append(name)
+    return names
+
+def iter_history(start: str = None, end: str = None):
+    """Потоково отдает записи истории из нужных сегментов, без загрузки всего файла."""
+    start_ts = to_epoch(start) if start is not None else None
+    end_ts = to_epoch(end) if end is not None else None
+    for name in list_segments(start, end):
+        with open(os.path.join(HISTORY_DIR, name), 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if start_ts is not None or end_ts is not None:
+                    ts = to_epoch(record['timestamp'])
+                    if start_ts is not None and ts < start_ts:
+                        continue
+                    if end_ts is not None and ts > end_ts:
+                        continue
+                yield record
+
 def read_rates():
-    """Читает данные из файла exchange_rates.json с помощью функции из interface.py."""
-    return load_json(RATES_FILE_PATH)
+    """Возвращает всю историю в прежнем формате exchange_rates.json: {"rates": [...], "metadata": {...}}."""
+    manifest = load_manifest()
+    return {"rates": list(iter_history()), "metadata": manifest.get('metadata', {})}
 
 def write_rates(data):
-    """Записывает данные в файл exchange_rates.json с помощью функции из interface.py."""
-    os.makedirs(os.path.dirname(RATES_FILE_PATH), exist_ok=True)
-    save_json(RATES_FILE_PATH, data)
+    """Дописывает записи data["rates"] в сегменты истории (O(размер пачки))."""
+    with STORAGE_SECONDS.time(operation='write_history'), \
+            tracing.span('storage.write_history', records=len(data.get('rates', []))):
+        manifest = load_manifest()
+        _append_records(manifest, data.get('rates', []))
+        if data.get('metadata'):
+            manifest['metadata'] = data['metadata']
+        _write_atomic(HISTORY_MANIFEST_PATH, manifest)
+    HISTORY_RECORDS.inc(len(data.get('rates', [])))
+
+# Запросы к истории: индексы по парам, отсортированные по времени
+
+class RateHistoryIndex:
+    """
+    Для каждой пары FROM_TO — отсортированные списки меток времени и записей.
+    Поиск на момент времени и по диапазону выполняется бинарным поиском.
+    """
+
+    def __init__(self, records=()):
+        self._times = {}    # pair -> [epoch, ...]
+        self._records = {}  # pair -> [record, ...] в том же порядке
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        pair = f"{record['from_currency']}_{record['to_currency']}"
+        times = self._times.setdefault(pair, [])
+        records = self._records.setdefault(pair, [])
+        ts = to_epoch(record['timestamp'])
+        if not times or ts >= times[-1]:
+            # Обычный случай: история дописывается по возрастанию времени
+            times.append(ts)
+            records.append(record)
+        else:
+            pos = bisect.bisect_right(times, ts)
+            times.insert(pos, ts)
+            records.insert(pos, record)
+
+    def pairs(self):
+        return sorted(self._times)
+
+    def rate_at(self, from_code: str, to_code: str, at: str):
+        """Последняя запись пары с меткой времени не позже at, либо None."""
+        pair = f"{from_code}_{to_code}"
+        times = self._times.get(pair)
+        if not times:
+            return None
+        pos = bisect.bisect_right(times, to_epoch(at))
+        return self._records[pair][pos - 1] if pos else None
+
+    def iter_range(self, from_code: str, to_code: str, start: str = None, end: str = None):
+        """Потоково отдает записи пары в интервале [start, end]."""
+        pair = f"{from_code}_{to_code}"
+        times = self._times.get(pair, [])
+        records = self._records.get(pair, [])
+        lo = bisect.bisect_left(times, to_epoch(start)) if start else 0
+        hi = bisect.bisect_right(times, to_epoch(end)) if end else len(times)
+        for i in range(lo, hi):
+            yield records[i]
+
+class SegmentIndexCache:
+    """
+    Индексы RateHistoryIndex по отдельным сегментам истории.
+
+    Индекс сегмента проверяется по (inode, mtime, размер) файла при каждом
+    обращении: сегменты только дописываются, поэтому при росте файла
+    дочитывается лишь новый хвост. Записи другого процесса (планировщик,
+    --script) видны сразу. В памяти — не больше max_segments последних
+    использованных сегментов.
+    """
+
+    def __init__(self, history_dir: str = HISTORY_DIR, max_segments: int = HISTORY_INDEX_SEGMENTS):
+        self.history_dir = history_dir
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # имя -> [stamp, inode, offset, index]
+
+    def get(self, name: str) -> RateHistoryIndex:
+        path = os.path.join(self.history_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return RateHistoryIndex()
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[1] != st.st_ino or st.st_size < entry[2]:
+                # Новый или замененный сегмент: читаем целиком
+                entry = [None, st.st_ino, 0, RateHistoryIndex()]
+            if entry[0] != stamp:
+                with STORAGE_SECONDS.time(operation='index_history_segment'), \
+                        tracing.span('storage.index_history_segment', segment=name):
+                    entry[2] = self._read_tail(path, entry[2], entry[3])
+                entry[0] = stamp
+            self._entries[name] = entry
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_segments:
+                self._entries.popitem(last=False)
+            return entry[3]
+
+    @staticmethod
+    def _read_tail(path, offset, index):
+        """Добавляет в index полные строки сегмента начиная с offset; возвращает новое смещение."""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # Недописанную последнюю строку оставляем до следующего обращения
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                index.add(json.loads(line))
+        return offset + end
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+segment_indexes = SegmentIndexCache()
+
+def get_rate_at(from_code: str, to_code: str, at: str):
+    """Последняя запись пары не позже at: сегменты просматриваются от at назад до первой находки."""
+    for name in reversed(list_segments(None, at)):
+        record = segment_indexes.get(name).rate_at(from_code, to_code, at)
+        if record is not None:
+            return record
+    return None
+
+def iter_rate_history(from_code: str, to_code: str, start: str = None, end: str = None):
+    """Записи пары в интервале [start, end] только из пересекающихся с ним сегментов."""
+    for name in list_segments(start, end):
+        yield from segment_indexes.get(name).iter_range(from_code, to_code, start, end)
+
+def read_rates2():
+    """Текущие курсы из rates.json."""
+    return rates_cache.get_rates(SIMPLE_6_FILE_PATH)
 
 def write_rates2(data):
     """Записывает данные в файл rates.json с помощью функции из interface.py."""
     os.makedirs(os.path.dirname(SIMPLE_6_FILE_PATH), exist_ok=True)
-    save_json(SIMPLE_6_FILE_PATH, data)
+    with STORAGE_SECONDS.time(operation='write_rates'), \
+            tracing.span('storage.write_rates', pairs=len(data.get('pairs', {}))):
+        save_json(SIMPLE_6_FILE_PATH, data)
+    # Сообщаем кешу курсов, что файл обновлен
+    rates_cache.invalidate()
@@ -1,34 +1,134 @@
 import logging
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timezone
 from .config import ParserConfig
+from .provider_stats import provider_stats
+from valutatrade_hub.infra.metrics import registry
+from valutatrade_hub.infra import tracing
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Метрики обновления: по last_refresh мониторинг считает устаревание курсов
+REFRESH_SECONDS = registry.histogram(
+    'valutatrade_rates_refresh_seconds', 'Длительность RatesUpdater.run_update')
+PROVIDER_FETCHES = registry.counter(
+    'valutatrade_rates_provider_fetch_total', 'Опросы источников курсов', ('provider', 'status'))
+PROVIDER_LAST_SUCCESS = registry.gauge(
+    'valutatrade_rates_provider_last_success_timestamp_seconds',
+    'Время последнего успешного ответа источника (unix)', ('provider',))
+LAST_REFRESH = registry.gauge(
+    'valutatrade_rates_last_refresh_timestamp_seconds', 'Время последнего подтвержденного обновления курсов (unix)')
+RATES_PAIRS = registry.gauge('valutatrade_rates_pairs', 'Число пар в rates.json')
+
 class RatesUpdater:
-    def __init__(self, api_clients, storage):
+    def __init__(self, api_clients, storage, concurrent=True, refresh_deadline=None):
         """
         :param api_clients: список экземпляров клиентов, реализующих fetch_rates()
         :param storage: объект хранилища с методом save(data: dict)
+        :param concurrent: опрашивать клиентов параллельно
+        :param refresh_deadline: общий лимит времени на опрос (секунды)
         """
         self.api_clients = api_clients
         self.storage = storage
+        self.concurrent = concurrent
+        self.refresh_deadline = refresh_deadline or ParserConfig.REFRESH_DEADLINE
+        self.last_sources = {}  # клиент -> множество пар из последнего обновления
+        self.last_errors = {}   # клиент -> {id: причина} для частично полученных данных
 
-    def run_update(self):
-        logger.info("Начало обновления курсов валют.")
-        aggregated_rates = {}
-        measurement_log = []  # список для журналов измерений
+    def _fetch_sequential(self):
+        overall_deadline = time.monotonic() + self.refresh_deadline
+        results = []
         for client in self.api_clients:
             client_name = client.__class__.__name__
             try:
                 logger.info(f"Запрос данных у клиента: {client_name}")
-                rates = client.fetch_rates()
+                results.append((client_name, self._traced_fetch(client, overall_deadline)))
+            except Exception as e:
+                logger.warning(f"Ошибка при получении данных от {client_name}: {e}")
+                results.append((client_name, None))
+        return results
+
+    @staticmethod
+    def _traced_fetch(client, deadline=None):
+        """
+        fetch_rates() в спане. Клиенты с атрибутом deadline (BaseApiClient)
+        получают срок, чтобы ожидание лимитера, таймауты и повторы в потоке
+        опроса укладывались в него, а не только ожидание результата.
+        """
+        with_deadline = deadline is not None and hasattr(client, 'deadline')
+        if with_deadline:
+            client.deadline = deadline
+        try:
+            with tracing.span('rates.fetch', client=client.__class__.__name__):
+                return client.fetch_rates()
+        finally:
+            if with_deadline:
+                client.deadline = None
+
+    def _fetch_concurrent(self):
+        """
+        Опрашивает всех клиентов одновременно. Каждому клиенту дается его
+        собственный лимит (client.timeout), всем вместе — refresh_deadline.
+        Результаты возвращаются в порядке self.api_clients, опоздавшие — None.
+        """
+        started = time.monotonic()
+        overall_deadline = started + self.refresh_deadline
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.api_clients)),
+                                      thread_name_prefix='rates-fetch')
+        futures = []
+        for client in self.api_clients:
+            logger.info(f"Запрос данных у клиента: {client.__class__.__name__}")
+            client_timeout = getattr(client, 'timeout', ParserConfig.REQUEST_TIMEOUT)
+            deadline = min(started + client_timeout, overall_deadline)
+            futures.append(executor.submit(tracing.bind(self._traced_fetch), client, deadline))
+
+        results = []
+        try:
+            for client, future in zip(self.api_clients, futures):
+                client_name = client.__class__.__name__
+                client_timeout = getattr(client, 'timeout', ParserConfig.REQUEST_TIMEOUT)
+                deadline = min(started + client_timeout, overall_deadline)
+                try:
+                    rates = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                    results.append((client_name, rates))
+                except FutureTimeoutError:
+                    logger.warning(f"Клиент {client_name} не ответил за отведенное время, пропускаем")
+                    results.append((client_name, None))
+                except Exception as e:
+                    logger.warning(f"Ошибка при получении данных от {client_name}: {e}")
+                    results.append((client_name, None))
+        finally:
+            # Не ждем зависшие запросы: их результат уже не нужен
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def run_update(self):
+        """Опрашивает клиентов и сохраняет курсы. Возвращает {имя клиента: успех}."""
+        with REFRESH_SECONDS.time(), tracing.span('rates.update', clients=len(self.api_clients)):
+            return self._run_update()
+
+    def _run_update(self):
+        logger.info("Начало обновления курсов валют.")
+        aggregated_rates = {}
+        sources = {}  # пара -> клиент, от которого взят курс
+        measurement_log = []  # список для журналов измерений
+        if self.concurrent and len(self.api_clients) > 1:
+            results = self._fetch_concurrent()
+        else:
+            results = self._fetch_sequential()
+
+        # Объединяем данные строго в порядке списка клиентов,
+        # поэтому итог не зависит от того, кто ответил первым
+        crypto_dict = ParserConfig().CRYPTO_ID_MAP  # например, {"BTC": "bitcoin", ...}
+        with tracing.span('rates.normalize') as normalize_span:
+            for client_name, rates in results:
+                if rates is None:
+                    continue
                 logger.info(f"Получено {len(rates)} курсов от {client_name}")
-                # Объединяем данные
-                parse_name_value = ParserConfig()
-                crypto_dict = parse_name_value.CRYPTO_ID_MAP  # например, {"BTC": "bitcoin", ...}
                 for key, value in rates.items():
                     matched = False
                     name_valute = key.split('_')[0]
@@ -37,50 +137,97 @@ class RatesUpdater:
                             new_key = f"{prefix}_USD"
                             if new_key not in aggregated_rates:
                                 aggregated_rates[new_key] = value
+                                sources[new_key] = client_name
                             matched = True
                             break
                     if not matched:
                         aggregated_rates[key] = value
-            except Exception as e:
-                logger.warning(f"Ошибка при получении данных от {client_name}: {e}")
+                        sources[key] = client_name
+            normalize_span.set_attribute('pairs', len(aggregated_rates))
+
+        self.last_sources = {}
+        for pair, client_name in sources.items():
+            self.last_sources.setdefault(client_name, set()).add(pair)
+
+        # Ошибки по отдельным id (например, пачка CoinGecko не ответила или id неизвестен)
+        self.last_errors = {}
+        for client in self.api_clients:
+            errors = getattr(client, 'last_errors', None)
+            if errors:
+                client_name = client.__class__.__name__
+                self.last_errors[client_name] = dict(errors)
+                sample = ', '.join(f"{key}: {reason}" for key, reason in list(errors.items())[:5])
+                more = f" и еще {len(errors) - 5}" if len(errors) > 5 else ""
+                logger.warning(f"{client_name}: нет курсов для {len(errors)} id ({sample}{more})")
+
+        # Итог по клиентам: True — данные получены
+        status = {client_name: rates is not None for client_name, rates in results}
+        now = time.time()
+        for client_name, ok in status.items():
+            PROVIDER_FETCHES.inc(provider=client_name, status='ok' if ok else 'error')
+            if ok:
+                PROVIDER_LAST_SUCCESS.set(now, provider=client_name)
+
+        # Замеры запросов сохраняем при любом исходе обновления
+        provider_stats.save()
+
+        # Если все ответившие источники вернули 304, курсы не изменились — хранилище не трогаем
+        clients_by_name = {client.__class__.__name__: client for client in self.api_clients}
+        answered = [clients_by_name[name] for name, rates in results if rates is not None]
+        if answered and all(getattr(client, 'not_modified', False) for client in answered):
+            logger.info("Источники сообщили, что курсы не изменились (304). Хранилище не обновляется.")
+            LAST_REFRESH.set(now)
+            logger.info("Обновление завершено.")
+            return status
+
+        # Ни один источник не дал курсов — rates.json и last_refresh не трогаем,
+        # иначе мониторинг не заметит устаревания курсов
+        if not aggregated_rates:
+            logger.error("Ни один источник не вернул курсы. Хранилище не обновляется.")
+            return status
 
         # После сбора всех курсов, формируем журнал измерений
-        for code, rate in aggregated_rates.items():
-            if rate is None:
-                # пропускаем или логируем ошибку, тут можно добавить
-                continue
-            try:
-                from_currency = code.split('_')[0].upper()
-                to_currency = code.split('_')[1].upper()
-                timestamp = datetime.now(timezone.utc).isoformat()
-                record_id = f"{from_currency}_{to_currency}_{timestamp}"
-
-                # Создаем мета-данные (можно дополнить)
-                meta = {
-                    "raw_id": from_currency.lower(),  # или источник
-                    "request_ms": 0,
-                    "status_code": 200,
-                    "etag": ""
-                }
-
-                measurement_entry = {
-                    "id": record_id,
-                    "from_currency": from_currency,
-                    "to_currency": to_currency,
-                    "rate": rate,
-                    "timestamp": timestamp,
-                    "source": client_name,
-                    "meta": meta
-                }
-                # добавляем запись в журнал
-                measurement_log.append(measurement_entry)
-            except Exception as e:
-                logger.warning(f"Ошибка при формировании журнала для {code}: {e}")
+        with tracing.span('rates.measurement_log') as measurement_span:
+            for code, rate in aggregated_rates.items():
+                if rate is None:
+                    # пропускаем или логируем ошибку, тут можно добавить
+                    continue
+                try:
+                    from_currency = code.split('_')[0].upper()
+                    to_currency = code.split('_')[1].upper()
+                    timestamp = datetime.now(timezone.utc).isoformat()
+                    last_request = getattr(clients_by_name[sources[code]], 'last_request', None)
+                    record_id = f"{from_currency}_{to_currency}_{timestamp}"
+
+                    # Создаем мета-данные (можно дополнить)
+                    meta = {
+                        "raw_id": from_currency.lower(),  # или источник
+                        "request_ms": round(last_request.duration_ms, 3) if last_request else 0,
+                        "status_code": last_request.status_code if last_request else 0,
+                        "etag": getattr(clients_by_name[sources[code]], 'last_etag', "")
+                    }
+
+                    measurement_entry = {
+                        "id": record_id,
+                        "from_currency": from_currency,
+                        "to_currency": to_currency,
+                        "rate": rate,
+                        "timestamp": timestamp,
+                        "source": sources[code],
+                        "meta": meta
+                    }
+                    # добавляем запись в журнал
+                    measurement_log.append(measurement_entry)
+                except Exception as e:
+                    logger.warning(f"Ошибка при формировании журнала для {code}: {e}")
+            measurement_span.set_attribute('records', len(measurement_log))
 
         # Добавляем метаданные
         update_metadata = {
             
-            "last_refresh": datetime.now(timezone.utc).isoformat() + 'Z'
+            "last_refresh": datetime.now(timezone.utc).isoformat() + 'Z',
+            # Задержки провайдеров (p50/p95/p99) на момент обновления
+            "providers": provider_stats.summaries(),
         }
         result = {
             "rates": measurement_log,
@@ -93,14 +240,18 @@ class RatesUpdater:
 
         # Формируем result с нужной структурой для result2
         now_iso = datetime.now(timezone.utc).isoformat()
+        # Частичное обновление (например, только крипта) не должно стирать
+        # остальные пары, поэтому начинаем с текущего содержимого rates.json
         pairs_dict = {}
+        if hasattr(self.storage, 'read_rates2'):
+            pairs_dict = {key: dict(value) for key, value in self.storage.read_rates2().get('pairs', {}).items()}
         for code, rate in aggregated_rates.items():
             from_currency, to_currency = code.split('_')
             pair_key = f"{from_currency}_{to_currency}"
             pairs_dict[pair_key] = {
                 "rate": rate,
                 "updated_at": now_iso,
-                "source": client_name  
+                "source": sources[code]
             }
 
         update_metadata = {
@@ -114,12 +265,16 @@ class RatesUpdater:
         # сохраняем результаты
         try:
             logger.info("Сохраняем обновленные данные в хранилище.")
-            self.storage.write_rates(result)
-            self.storage.write_rates2(result2)
+            with tracing.span('rates.save'):
+                self.storage.write_rates(result)
+                self.storage.write_rates2(result2)
+            LAST_REFRESH.set(now)
+            RATES_PAIRS.set(len(pairs_dict))
             # здесь можно дополнительно сохранить журнал, например, в файл или базу
             # self.storage.write_measurements(measurement_log)
             logger.info("Данные успешно сохранены.")
         except Exception as e:
             logger.error(f"Ошибка при сохранении данных: {e}")
 
-        logger.info("Обновление завершено.")
\ No newline at end of file
+        logger.info("Обновление завершено.")
+        return status
\ No newline at end of file